@@ -0,0 +1,80 @@
+"""
+Benchmarks replaying a compiled bundle against preparing and rendering the templates for every account pair
+
+For each dcr_version, the deployment plan is compiled once. Then every account pair is prepared and produces the
+statements execution would send: once by rendering and splitting the templates, and once by filling the bundle's
+slots. The statements are checked to be identical, and only client-side time is measured.
+
+Usage: python benchmarks/bench_bundle.py [--statements N] [--pairs N]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, ".."))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from bench_dcr import DCR_VERSIONS, generate_templates  # noqa: E402
+from snowflake_dcr import DcrBundle, SnowflakeDcr  # noqa: E402
+
+
+def plan_statements(dcr):
+    return [list(dcr._plan_statements(script)) for script in dcr.script_list]
+
+
+def prepare(dcr_version, pair, path):
+    dcr = SnowflakeDcr()
+    dcr.is_validating = False
+    dcr.prepare_deployment(False, dcr_version, "PROV" + str(pair), None, "CONS" + str(pair), None, "", path)
+    return dcr
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--statements", type=int, default=2000, help="statements per script")
+    parser.add_argument("--pairs", type=int, default=20, help="account pairs to roll out to")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workspace:
+        path = os.path.join(workspace, "templates") + os.sep
+        os.makedirs(path)
+        generate_templates(path, args.statements)
+
+        print("%-16s %12s %12s %14s %14s %9s" % ("dcr_version", "bundle KB", "compile s", "render s/pair",
+                                                  "replay s/pair", "speedup"))
+        for dcr_version in DCR_VERSIONS:
+            bundle_path = os.path.join(workspace, "deployment.dcrb")
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                prepare(dcr_version, 0, path).compile_bundle(bundle_path).close()
+            compile_time = time.perf_counter() - start
+
+            render_time = 0.0
+            replay_time = 0.0
+            bundle = DcrBundle.load(bundle_path)
+            for pair in range(1, args.pairs + 1):
+                start = time.perf_counter()
+                expected = plan_statements(prepare(dcr_version, pair, path))
+                render_time += time.perf_counter() - start
+
+                start = time.perf_counter()
+                dcr = prepare(dcr_version, pair, path)
+                dcr.replay_bundle(bundle)
+                actual = plan_statements(dcr)
+                replay_time += time.perf_counter() - start
+
+                assert actual == expected, "Bundle replay differs from rendering for " + dcr_version
+            bundle.close()
+
+            print("%-16s %12.1f %12.3f %14.4f %14.4f %8.1fx" % (
+                dcr_version, os.path.getsize(bundle_path) / 1024, compile_time, render_time / args.pairs,
+                replay_time / args.pairs, render_time / replay_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+End-to-end benchmarks for every SnowflakeDcr prepare_ path against fake connections
+
+Every prepare_ method is run for all three dcr_version flavours and executed against FakeConnection with the default
+settings, so render caching, journaling and validation are part of what is measured. Each case runs in a fresh
+directory with its own synthetic templates, holding only the placeholders its plan replaces. Results are appended to
+a JSONL file (benchmarks/results.jsonl by default, ignored by git) with the current git commit, and each case is
+compared with the latest result recorded for a different commit.
+
+Overhead is the wall time of the same case against connections without latency, which stays meaningful when
+statements overlap with --parallel, --max-in-flight or --batch-size.
+
+Usage: python benchmarks/bench_dcr.py [--statements N] [--latency SECONDS] [--rows N] [--streaming] [--parallel]
+                                     [--max-in-flight N] [--batch-size N]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, ".."))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from fake_snowflake import FakeConnection  # noqa: E402
+from snowflake_dcr import PLACEHOLDER_FAMILIES, SnowflakeDcr, TraceCollector  # noqa: E402
+
+DCR_VERSIONS = ["6.0 Native App", "5.5 Jinja", "5.5 SQL Param"]
+
+SCRIPTS = ["provider_init", "provider_templates", "provider_init_new_consumer", "provider_add_consumer_to_share",
+           "provider_enable_consumer", "provider_ml", "provider_upgrade", "provider_uninstall",
+           "consumer_init", "consumer_init_new_provider", "consumer_ml", "consumer_uninstall"]
+
+# One statement per placeholder family, cycled through to build each template; placeholders a plan doesn't replace are
+# taken out, since validate rejects them
+STATEMENTS = [
+    "use role accountadmin;\n",
+    "create or replace database dcr_DEMO_provider_db comment = 'SNOWCAT2 provider';\n",
+    "create or replace schema dcr_samp_provider_db.cleanroom;\n",
+    "grant usage on database dcr_demo_provider_db to share dcr_demo_app;\n",
+    "alter share dcr_DEMO_app add accounts = SNOWCAT;\n",
+    "alter share dcr_SAMP_app_two add accounts = PROVIDER2_ACCT, CONSUMER_ACCT;\n",
+    "insert into dcr_samp_provider_db.templates.dcr_templates (party_account, template_name, template)\n"
+    "values ('PROVIDER_ACCT', 'customer_overlap', $$select identifier({{ dimensions[0] }}), count(distinct p.email)\n"
+    "from identifier({{ source_table[0] }}) p join identifier({{ my_table[0] }}) c on c.email = p.email\n"
+    "where c.account = 'consumer_acct' // inline comment\n"
+    "group by 1 having count(distinct p.email) > 25$$);\n",
+    "select dcr_samp_provider_db.cleanroom.get_sql_js(template, request_params) as valid_sql from requests;\n",
+    "select dcr_samp_app.cleanroom.get_sql_js(request_id) from dcr_samp_consumer.util.requests;\n",
+    "grant reference_usage on database dcr_demo_provider_db to share DCR_DEMO_APP_TWO;\n",
+    "call dcr_demo_app_two.cleanroom.request('SNOWCAT3', 'snowcat4', 'snowcat2', 'provider_acct');\n",
+    "-- A full-line comment\n",
+    "// Another comment style\n",
+    "select current_account(), 'snowcat', 'provider2_acct', '_demo_', '_samp_';\n",
+]
+
+
+def generate_templates(path, statements, check_words):
+    """
+    Writes every script used by a prepare_ method, each with the given number of statements and only the placeholders
+    among check_words
+    """
+    placeholder_regex = re.compile("|".join(PLACEHOLDER_FAMILIES), re.IGNORECASE)
+    block = placeholder_regex.sub(lambda match: match.group() if match.group() in check_words else "x",
+                                  "".join(STATEMENTS))
+    per_block = sum(1 for statement in STATEMENTS if not statement.lstrip().startswith(("--", "//")))
+    repeats = statements // per_block + 1
+    for script in SCRIPTS:
+        with open(os.path.join(path, script + ".sql"), "w", encoding='utf-8') as fout:
+            fout.write(block * repeats)
+
+
+def cases():
+    """
+    Yields (name, prepare callable) for every prepare_ path and dcr_version flavour; prepare is called with the
+    SnowflakeDcr, the provider and consumer connections and the template path
+    """
+    for dcr_version in DCR_VERSIONS:
+        yield "deployment/" + dcr_version, lambda dcr, prov, cons, path, v=dcr_version: dcr.prepare_deployment(
+            False, v, "PROV1.us-east-1", prov, "CONS1", cons, "", path)
+        yield "consumer_addition/" + dcr_version, \
+            lambda dcr, prov, cons, path, v=dcr_version: dcr.prepare_consumer_addition(
+                False, v, "PROV1", prov, "CONS2", cons, "", path)
+        yield "provider_addition/" + dcr_version, \
+            lambda dcr, prov, cons, path, v=dcr_version: dcr.prepare_provider_addition(
+                False, v, "PROV2", prov, "CONS1", cons, "", "", path)
+        for account_type in ("Provider", "Consumer"):
+            yield "uninstall_" + account_type.lower() + "/" + dcr_version, \
+                lambda dcr, prov, cons, path, v=dcr_version, t=account_type: dcr.prepare_uninstall(
+                    False, v, t, "PROV1", prov, "CONS1", "", "", path)
+    yield "upgrade", lambda dcr, prov, cons, path: dcr.prepare_upgrade(False, "PROV1", prov, "CONS1", cons, "", "",
+                                                                       path)
+
+
+def run_case(prepare, args, provider_conn, consumer_conn, workspace):
+    """
+    Runs one prepared plan with the default settings in a new directory under workspace and returns its measurements
+    """
+    run_directory = tempfile.mkdtemp(dir=workspace)
+    os.chdir(run_directory)
+    path = os.path.join(run_directory, "templates") + os.sep
+    os.makedirs(path)
+
+    dcr = SnowflakeDcr()
+    dcr.is_streaming = args.streaming
+    dcr.max_in_flight = args.max_in_flight
+    dcr.batch_size = args.batch_size
+    prepare(dcr, provider_conn, consumer_conn, path)
+    generate_templates(path, args.statements, dcr.check_words)
+    collector = TraceCollector()
+    collector.attach(dcr)
+
+    executed_before = provider_conn.execute_count + consumer_conn.execute_count
+    round_trips_before = provider_conn.round_trips + consumer_conn.round_trips
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        if args.parallel:
+            dcr.execute_parallel()
+        else:
+            dcr.execute_locally()
+        wall = time.perf_counter() - start
+
+    statements = provider_conn.execute_count + consumer_conn.execute_count - executed_before
+    round_trips = provider_conn.round_trips + consumer_conn.round_trips - round_trips_before
+    render_seconds = sum(event["dur"] for event in collector.events if event["cat"] == "render") / 1000000
+    statement_seconds = sum(statement["duration"] for statement in collector.statements)
+    rendered_bytes = sum(os.path.getsize(os.path.join(path, script + ".sql")) for script in dcr.script_list)
+    return {
+        "scripts": len(dcr.script_list),
+        "statements": statements,
+        "round_trips": round_trips,
+        "wall_seconds": wall,
+        "render_seconds": render_seconds,
+        "render_mb_per_second": rendered_bytes / 1024 / 1024 / render_seconds if render_seconds else None,
+        "round_trip_seconds": statement_seconds,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_results(results_path, commit, settings):
+    """
+    Returns the latest result per case recorded for another commit with the same settings
+    """
+    previous = {}
+    if not os.path.exists(results_path):
+        return previous
+    with open(results_path, "r", encoding='utf-8') as fin:
+        for line in fin:
+            entry = json.loads(line)
+            if entry["commit"] != commit and entry["settings"] == settings:
+                previous[entry["case"]] = entry
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--statements", type=int, default=2000, help="statements per script")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per statement")
+    parser.add_argument("--rows", type=int, default=1, help="rows returned per statement")
+    parser.add_argument("--streaming", action="store_true", help="use is_streaming")
+    parser.add_argument("--parallel", action="store_true", help="use execute_parallel")
+    parser.add_argument("--max-in-flight", type=int, default=1, help="async statements per connection")
+    parser.add_argument("--batch-size", type=int, default=1, help="statements per multi-statement request")
+    parser.add_argument("--results", default=os.path.join(BENCHMARK_DIR, "results.jsonl"),
+                        help="JSONL file results are appended to")
+    args = parser.parse_args()
+
+    settings = {"statements": args.statements, "latency": args.latency, "rows": args.rows,
+                "streaming": args.streaming, "parallel": args.parallel, "max_in_flight": args.max_in_flight,
+                "batch_size": args.batch_size}
+    commit = git_commit()
+    previous = previous_results(args.results, commit, settings)
+
+    provider_conn = FakeConnection(latency=args.latency, rows=args.rows, name="provider")
+    consumer_conn = FakeConnection(latency=args.latency, rows=args.rows, name="consumer")
+    # With latency, each case runs again on these to measure the client's own overhead
+    baseline_provider_conn = FakeConnection(rows=args.rows, name="provider")
+    baseline_consumer_conn = FakeConnection(rows=args.rows, name="consumer")
+
+    original_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as workspace:
+        try:
+            results = []
+            print("%-36s %10s %11s %10s %12s %14s %10s" % ("case", "statements", "round trips", "wall s",
+                                                           "render MB/s", "overhead us/st", "vs prev"))
+            for name, prepare in cases():
+                result = run_case(prepare, args, provider_conn, consumer_conn, workspace)
+                overhead = result["wall_seconds"]
+                if args.latency:
+                    overhead = run_case(prepare, args, baseline_provider_conn, baseline_consumer_conn,
+                                        workspace)["wall_seconds"]
+                result.update({"overhead_seconds": overhead,
+                               "overhead_us_per_statement": overhead / result["statements"] * 1000000
+                               if result["statements"] else None,
+                               "case": name, "commit": commit, "time": time.time(), "settings": settings})
+                results.append(result)
+
+                change = ""
+                if name in previous and previous[name]["wall_seconds"]:
+                    change = "%+.1f%%" % ((result["wall_seconds"] / previous[name]["wall_seconds"] - 1) * 100)
+                print("%-36s %10d %11d %10.3f %12.1f %14.1f %10s" % (
+                    name, result["statements"], result["round_trips"], result["wall_seconds"],
+                    result["render_mb_per_second"] or 0,
+                    result["overhead_us_per_statement"] or 0, change))
+        finally:
+            os.chdir(original_directory)
+
+    with open(args.results, "a", encoding='utf-8') as fout:
+        for result in results:
+            fout.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmarks split_sql against the previous statement path: the "//" comment regex over every rendered line followed by
+the connector's split_statements with remove_comments=True
+
+The connector's split_statements on its own is timed too and used as the reference output: split_sql should match
+it statement for statement, while the regex pass cuts string literals and $$ bodies at "//" and loses statements.
+
+Usage: python benchmarks/bench_split.py [size_mb]
+"""
+import io
+import os
+import re
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, ".."))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from snowflake.connector.util_text import split_statements  # noqa: E402
+
+from bench_dcr import STATEMENTS  # noqa: E402
+from snowflake_dcr import split_sql  # noqa: E402
+
+COMMENT_CODE_REGEX = re.compile(r"(?<!:)//.*")
+
+EXTRA_STATEMENTS = [
+    "create or replace function dcr_demo_app.cleanroom.js_udf(x string) returns string language javascript as $$\n"
+    "  // Keep the scheme: https://example.com/a;b\n"
+    "  return X + '//' + 'done;';\n"
+    "$$;\n",
+    "/* A block comment\n   spanning lines; with a semicolon */\n",
+    "select 'http://example.com', \"weird//name\" from dcr_demo_app.cleanroom.urls; -- trailing\n",
+]
+
+
+def generate_script(size_mb):
+    """
+    Builds a synthetic script of roughly size_mb megabytes
+    """
+    target = int(size_mb * 1024 * 1024)
+    block = "".join(STATEMENTS + EXTRA_STATEMENTS)
+    return block * (target // len(block) + 1)
+
+
+def split_previous(script):
+    stripped = "".join(re.sub(COMMENT_CODE_REGEX, '', line) for line in io.StringIO(script))
+    return [entry for entry in split_statements(io.StringIO(stripped), remove_comments=True) if entry[0]]
+
+
+def split_connector(script):
+    return [entry for entry in split_statements(io.StringIO(script), remove_comments=True) if entry[0]]
+
+
+def split_lexer(script):
+    return list(split_sql(io.StringIO(script)))
+
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 8
+    script = generate_script(size_mb)
+    size = len(script.encode("utf-8")) / 1024 / 1024
+
+    reference = split_connector(script)
+    print("Script size: %.1f MB, %d statements" % (size, len(reference)))
+    print("%-22s %10s %10s %10s %16s" % ("path", "statements", "seconds", "MB/s", "match connector"))
+
+    timings = {}
+    for name, function in (("regex + connector", split_previous), ("connector only", split_connector),
+                           ("split_sql", split_lexer)):
+        statements, timings[name] = time_call(function, script)
+        print("%-22s %10d %10.3f %10.1f %16s" % (name, len(statements), timings[name], size / timings[name],
+                                                 statements == reference))
+
+    print("split_sql speedup over regex + connector: %.2fx" % (timings["regex + connector"] / timings["split_sql"]))
+
+
+if __name__ == "__main__":
+    main()
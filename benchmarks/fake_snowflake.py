@@ -0,0 +1,185 @@
+"""
+An in-process stand-in for a snowflake.connector connection, for benchmarks and local runs
+
+Only the parts SnowflakeDcr uses are implemented. Every request sleeps for a configurable latency to simulate the
+client-server round-trip and returns a configurable number of rows per statement. Async queries finish latency seconds
+after they are submitted, so several can be running at once, and a multi-statement request (num_statements) costs one
+round-trip for all of its statements. Statements run with execute are kept in a session query history, with
+multi-statement requests and their child queries, for queries on information_schema.query_history_by_session.
+"""
+import io
+import itertools
+import threading
+import time
+
+from snowflake.connector.util_text import split_statements
+
+
+class FakeCursor:
+    """
+    A cursor whose execute simulates one round-trip
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.query = None
+        self.sfqid = None
+        self.rowcount = None
+        self._rows = iter(())
+        self._next_results = []
+
+    def execute(self, command, params=None, _is_put_get=None, num_statements=None, **kwargs):
+        self.connection.round_trips += 1
+        if "query_history_by_session" in command:
+            self.connection.execute_count += 1
+            self._set_result(command, next(self.connection.query_ids), list(self.connection.history))
+            return self
+
+        commands = [command]
+        parent_id = None
+        if num_statements is not None:
+            commands = [statement for statement, _ in split_statements(io.StringIO(command)) if statement]
+            parent_id = next(self.connection.query_ids)
+            if num_statements and len(commands) != num_statements:
+                self.connection.record(parent_id, "MULTI_STATEMENT", "FAILED_WITH_ERROR")
+                raise FakeProgrammingError("Expected " + str(num_statements) + " statements, got " +
+                                           str(len(commands)), parent_id)
+
+        self.connection.execute_count += len(commands)
+        if self.connection.latency:
+            time.sleep(self.connection.latency)
+        if parent_id is not None:
+            failed = self.connection.fail_on is not None and any(map(self.connection.fail_on, commands))
+            self.connection.record(parent_id, "MULTI_STATEMENT", "FAILED_WITH_ERROR" if failed else "SUCCESS")
+        query_ids = []
+        for statement in commands:
+            query_ids.append(next(self.connection.query_ids))
+            if self.connection.fail_on is not None and self.connection.fail_on(statement):
+                self.connection.record(query_ids[-1], "UNKNOWN", "FAILED_WITH_ERROR")
+                raise FakeProgrammingError("Simulated failure for: " + statement[:80], parent_id or query_ids[-1])
+            self.connection.record(query_ids[-1], "UNKNOWN", "SUCCESS")
+            with self.connection.lock:
+                self.connection.statements.append(statement)
+
+        self._next_results = list(zip(commands[1:], query_ids[1:]))
+        self._set_result(commands[0], query_ids[0])
+        return self
+
+    def executemany(self, command, seqparams, **kwargs):
+        for params in seqparams:
+            self.execute(command, params)
+        return self
+
+    def nextset(self):
+        if not self._next_results:
+            return None
+        self._set_result(*self._next_results.pop(0))
+        return self
+
+    def _set_result(self, command, sfqid, rows=None):
+        self.query = command
+        self.sfqid = sfqid
+        if rows is None:
+            rows = [self.connection.row] * self.connection.rows
+        self.rowcount = len(rows)
+        self._rows = iter(rows)
+
+    def execute_async(self, command, **kwargs):
+        self.connection.execute_count += 1
+        self.connection.round_trips += 1
+        self.query = command
+        self.sfqid = next(self.connection.query_ids)
+        failed = self.connection.fail_on is not None and self.connection.fail_on(command)
+        with self.connection.lock:
+            self.connection.async_queries[self.sfqid] = (time.perf_counter() + self.connection.latency, failed)
+            self.connection.statements.append(command)
+        return {"queryId": self.sfqid}
+
+    def get_results_from_sfqid(self, sfqid):
+        self.connection.get_query_status_throw_if_error(sfqid)
+        self.sfqid = sfqid
+        self.rowcount = self.connection.rows
+        self._rows = (self.connection.row for _ in range(self.connection.rows))
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=1):
+        return list(itertools.islice(self._rows, size))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        self._rows = iter(())
+
+    def __iter__(self):
+        return self._rows
+
+
+class FakeProgrammingError(Exception):
+    """
+    Raised for statements matched by fail_on, carrying a query id like the connector's ProgrammingError
+    """
+    def __init__(self, msg, sfqid):
+        super().__init__(msg)
+        self.sfqid = sfqid
+
+
+class FakeConnection:
+    """
+    A connection with per-request latency (seconds) and result size (rows per statement, row_width columns)
+
+    fail_on is an optional callable taking the statement text; when it returns True the statement raises
+    """
+    _query_id_counter = itertools.count(1)
+
+    def __init__(self, latency=0.0, rows=1, row_width=1, fail_on=None, name="fake"):
+        self.latency = latency
+        self.rows = rows
+        self.row = tuple("value" for _ in range(row_width))
+        self.fail_on = fail_on
+        self.name = name
+        self.account = name
+        self.execute_count = 0
+        self.round_trips = 0
+        self.closed = False
+        self.statements = []
+        self.lock = threading.Lock()
+        self.async_queries = {}
+        # (query_id, query_type, execution_status, start_time) rows for query_history_by_session
+        self.history = []
+        self.query_ids = ("01fake-" + name + "-" + str(next(self._query_id_counter)) for _ in itertools.count())
+
+    def record(self, query_id, query_type, status):
+        with self.lock:
+            self.history.append((query_id, query_type, status, len(self.history)))
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self)
+
+    def execute_stream(self, stream, remove_comments=False, cursor_class=None, **kwargs):
+        for statement, is_put_or_get in split_statements(stream, remove_comments=remove_comments):
+            if statement:
+                yield self.cursor().execute(statement, _is_put_get=is_put_or_get, **kwargs)
+
+    def get_query_status(self, sf_qid):
+        finish_time, failed = self.async_queries[sf_qid]
+        if time.perf_counter() < finish_time:
+            return "RUNNING"
+        return "FAILED_WITH_ERROR" if failed else "SUCCESS"
+
+    def get_query_status_throw_if_error(self, sf_qid):
+        status = self.get_query_status(sf_qid)
+        if status == "FAILED_WITH_ERROR":
+            raise FakeProgrammingError("Simulated async failure for " + sf_qid, sf_qid)
+        return status
+
+    @staticmethod
+    def is_still_running(status):
+        return status == "RUNNING"
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
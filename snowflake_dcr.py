@@ -1,6 +1,1086 @@
 import os
 import re
 import glob
+import io
+import csv
+import json
+import mmap
+import struct
+import time
+import shutil
+import tempfile
+import hashlib
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Statements that only change session state; incremental runs always send them
+SESSION_STATEMENT_REGEX = re.compile(r"\s*(use|set|unset|alter\s+session)\b", re.IGNORECASE)
+
+# Events SnowflakeDcr.subscribe accepts, each called with keyword details:
+#   run_*: mode, start, duration (end/error), error (error)
+#   script_*: script, start, duration (end/error), error (error)
+#   statement_*: script, index, statement, start, duration (end/error), query_id and rows (end), error (error)
+#   render: script, start, duration, cached
+HOOK_EVENTS = ("run_start", "run_end", "run_error",
+               "script_start", "script_end", "script_error",
+               "statement_start", "statement_end", "statement_error",
+               "render")
+
+# SnowflakeDcr attributes that control how a plan runs, shared by the members of a consumer fleet
+EXECUTION_SETTINGS = ("output_directory", "keep_runs", "render_cache", "is_streaming", "write_prepared", "journal",
+                      "is_resuming", "is_incremental", "fingerprint_store", "max_in_flight", "is_validating",
+                      "batch_size", "batch_max_bytes", "result_sink", "session_pool", "subscribers")
+
+
+# Pieces used by statement_accesses to find the objects a statement reads and writes
+IDENTIFIER = r'(?:"[^"]*"|[A-Za-z_][\w$]*)'
+OBJECT_NAME = IDENTIFIER + r'(?:\s*\.\s*' + IDENTIFIER + r'){0,2}'
+OBJECT_TYPES = (r"(?:database\s+role|application\s+role|application\s+package|masking\s+policy|row\s+access\s+policy|"
+                r"network\s+rule|network\s+policy|file\s+format|materialized\s+view|external\s+table|database|schema|"
+                r"table|view|function|procedure|stage|share|role|application|warehouse|stream|task|sequence|tag|"
+                r"secret|pipe|listing|integration)")
+LITERAL_REGEX = re.compile(r"\$\$.*?\$\$|'(?:[^'\\]|\\.|'')*'", re.DOTALL)
+CREATE_REGEX = re.compile(r"\s*create\s+(?:or\s+replace\s+)?(?:(?:secure|transient|temporary|temp|volatile|local|"
+                          r"global|recursive|dynamic|hybrid)\s+)*" + OBJECT_TYPES +
+                          r"\s+(?:if\s+not\s+exists\s+)?(?P<name>" + OBJECT_NAME + ")", re.IGNORECASE)
+DROP_ALTER_REGEX = re.compile(r"\s*(?:drop|alter)\s+" + OBJECT_TYPES + r"\s+(?:if\s+exists\s+)?(?P<name>" +
+                              OBJECT_NAME + ")", re.IGNORECASE)
+INSERT_REGEX = re.compile(r"\s*insert\s+(?P<overwrite>overwrite\s+)?(?:all\s+)?into\s+(?P<name>" + OBJECT_NAME +
+                          ")", re.IGNORECASE)
+WRITE_REGEX = re.compile(r"\s*(?:update|delete\s+from|merge\s+into|truncate\s+(?:table\s+)?(?:if\s+exists\s+)?)"
+                         r"\s*(?P<name>" + OBJECT_NAME + ")", re.IGNORECASE)
+GRANT_REGEX = re.compile(r"\s*(?P<verb>grant|revoke)\s+(?:.+?\s+)?on\s+(?:[a-z]+\s+){0,3}?(?P<object>" +
+                         OBJECT_NAME + r")\s+(?:to|from)\s+(?:[a-z]+\s+){0,2}?(?P<grantee>" + OBJECT_NAME +
+                         r")\s*(?:with\s+grant\s+option\s*)?;?\s*$", re.IGNORECASE | re.DOTALL)
+GRANT_ROLE_REGEX = re.compile(r"\s*(?P<verb>grant|revoke)\s+(?:database\s+|application\s+)?role\s+(?P<object>" +
+                              OBJECT_NAME + r")\s+(?:to|from)\s+(?:[a-z]+\s+){0,2}?(?P<grantee>" + OBJECT_NAME +
+                              r")\s*;?\s*$", re.IGNORECASE)
+# Creating a database or schema also makes it the session's current one, changing what later unqualified names mean
+CREATE_CONTAINER_REGEX = re.compile(r"\s*create\s+(?:or\s+replace\s+)?(?:transient\s+)?(?:database|schema)\s+"
+                                    r"(?!role\b)", re.IGNORECASE)
+BULK_GRANT_REGEX = re.compile(r"\s*(?:grant|revoke)\b.*\bon\s+(?:all|future)\b", re.IGNORECASE | re.DOTALL)
+QUERY_REGEX = re.compile(r"\s*(?:select|with)\b", re.IGNORECASE)
+READ_REGEXES = (re.compile(r"\b(?:from|join|using|clone|like|share|schema|database)\s+(?P<name>" + OBJECT_NAME + ")",
+                           re.IGNORECASE),
+                re.compile(r"(?P<name>" + IDENTIFIER + r"(?:\s*\.\s*" + IDENTIFIER + r"){1,2})"),
+                re.compile(r"(?P<name>" + OBJECT_NAME + r")\s*\("))
+
+# Bundle files written by SnowflakeDcr.compile_bundle; slots are numbered markers while a bundle is compiled, and a
+# slot value must not change how split_sql splits and strips the statement around it
+BUNDLE_MAGIC = b"DCRBUNDLE1\n"
+SLOT_REGEX = re.compile("\x00(\\d+)\x00")
+UNSAFE_SLOT_VALUE_REGEX = re.compile(r"['\";\n\x00]|\$\$|--|//|/\*|\*/")
+
+# Session facts SessionPool fetches once per session, and the probe statements it answers from them
+SESSION_FACTS = ("current_user", "current_role", "current_account", "current_region", "current_warehouse")
+PROBE_REGEX = re.compile(r"\s*select\s+(?P<columns>current_[a-z]+\(\s*\)(?:\s*,\s*current_[a-z]+\(\s*\))*)\s*;?\s*$",
+                         re.IGNORECASE)
+# Placeholder families the templates use; validate flags leftovers from the families a plan's check words belong to
+PLACEHOLDER_FAMILIES = (r"SNOWCAT\d*", r"(?:PROVIDER\d*|CONSUMER)_ACCT", r"_DEMO_", r"_SAMP_")
+# Creates that bring the objects inside along with the new database or schema
+CREATE_WITH_CONTENTS_REGEX = re.compile(r"\b(?:from\s+(?:share|application)|clone)\b", re.IGNORECASE)
+# Databases every account has, which a plan never needs to create
+SYSTEM_DATABASES = ("SNOWFLAKE", "SNOWFLAKE_SAMPLE_DATA")
+
+# The only session statements that change a fact; name is missing when the target isn't a plain identifier
+USE_CONTEXT_REGEX = re.compile(r"\s*use\s+(?P<kind>role|warehouse)\b(?:\s+(?P<name>" + IDENTIFIER +
+                               r")\s*;?\s*$)?", re.IGNORECASE)
+# Statements that may change the current warehouse as a side effect: a new warehouse becomes the current one unless
+# it already existed, and dropping the current one leaves none
+WAREHOUSE_CHANGE_REGEX = re.compile(r"\s*(?:create|drop)\s+(?:or\s+replace\s+)?warehouse\b", re.IGNORECASE)
+
+
+def _object_parts(name):
+    """
+    Splits an object name into identifier parts, upper-casing unquoted ones the way Snowflake resolves them
+    """
+    parts = re.findall(IDENTIFIER, name)
+    return tuple(part[1:-1] if part.startswith('"') else part.upper() for part in parts)
+
+
+def statement_accesses(statement):
+    """
+    Returns {object name parts: "read" | "append" | "write"} for the objects a statement touches, or None when that
+    cannot be worked out safely (session statements, CREATE DATABASE/SCHEMA, which switch the session to the new
+    container, CALL, grants on ALL/FUTURE objects, anything unrecognised)
+
+    Appends are INSERTs and grants to a grantee; appends to the same object may run in any order.
+    """
+    if (SESSION_STATEMENT_REGEX.match(statement) or CREATE_CONTAINER_REGEX.match(statement) or
+            BULK_GRANT_REGEX.match(statement)):
+        return None
+    masked = LITERAL_REGEX.sub("''", statement)
+
+    targets = {}
+    match = CREATE_REGEX.match(masked) or DROP_ALTER_REGEX.match(masked) or WRITE_REGEX.match(masked)
+    if match:
+        targets[_object_parts(match.group("name"))] = "write"
+    elif INSERT_REGEX.match(masked):
+        match = INSERT_REGEX.match(masked)
+        targets[_object_parts(match.group("name"))] = "write" if match.group("overwrite") else "append"
+    elif GRANT_ROLE_REGEX.match(masked) or GRANT_REGEX.match(masked):
+        match = GRANT_ROLE_REGEX.match(masked) or GRANT_REGEX.match(masked)
+        targets[_object_parts(match.group("grantee"))] = "append" if match.group("verb").lower() == "grant" else "write"
+        targets[_object_parts(match.group("object"))] = "read"
+    elif not QUERY_REGEX.match(masked):
+        return None
+
+    accesses = dict(targets)
+    body = masked[match.end():] if match else masked
+    for regex in READ_REGEXES:
+        for read in regex.finditer(body):
+            parts = _object_parts(read.group("name"))
+            if parts and accesses.get(parts, "read") != "read":
+                accesses[parts] = "write"
+            else:
+                accesses.setdefault(parts, "read")
+    return accesses
+
+
+def _container_use(statement):
+    """
+    Returns the USE statement that sets the session's context the way a CREATE DATABASE/SCHEMA statement does, or
+    None for other statements
+    """
+    if not CREATE_CONTAINER_REGEX.match(statement):
+        return None
+    match = CREATE_REGEX.match(LITERAL_REGEX.sub("''", statement))
+    if match is None:
+        return None
+    kind = "database" if re.match(r"\s*create\s+(?:or\s+replace\s+)?(?:transient\s+)?database\b", statement,
+                                  re.IGNORECASE) else "schema"
+    return "use " + kind + " " + match.group("name") + ";"
+
+
+def accesses_conflict(first, second):
+    """
+    Returns True when two statements with these statement_accesses results must not run at the same time
+
+    Names are compared conservatively: one conflicts with another when its parts appear in order inside the other,
+    which covers unqualified names and containers such as a database and the tables in it
+    """
+    if first is None or second is None:
+        return True
+    for first_name, first_mode in first.items():
+        for second_name, second_mode in second.items():
+            if first_mode == second_mode and first_mode in ("read", "append"):
+                continue
+            shorter, longer = sorted((first_name, second_name), key=len)
+            if any(longer[start:start + len(shorter)] == shorter for start in range(len(longer) - len(shorter) + 1)):
+                return True
+    return False
+
+
+# Tokens split_sql looks for outside strings and comments; "//" after ":" is part of a URL such as file:///
+SQL_TOKEN_REGEX = re.compile(r"'|\"|\$\$|--|(?<![:/])//|/\*|;")
+SQL_STRING_END_REGEX = re.compile(r"(?:[^'\\]|\\.|'')*'", re.DOTALL)
+SQL_IDENTIFIER_END_REGEX = re.compile(r'[^"]*"')
+PUT_GET_REGEX = re.compile(r"\s*(?:put|get)\b", re.IGNORECASE)
+
+
+def split_sql(stream):
+    """
+    Splits a readable SQL script into (statement, is_put_or_get) pairs in one pass, like the connector's
+    split_statements with remove_comments=True
+
+    Quoted strings, quoted identifiers and $$ bodies are kept as written, including any "//" or ";" inside them.
+    --, // and /* */ comments outside them are dropped, each statement keeps its terminating ";" and empty
+    statements are skipped.
+    """
+    state = None
+    parts = []
+    for line in iter(stream.readline, ""):
+        position = 0
+        while position < len(line):
+            if state == "'":
+                match = SQL_STRING_END_REGEX.match(line, position)
+                end = match.end() if match else len(line)
+                parts.append(line[position:end])
+            elif state == '"':
+                match = SQL_IDENTIFIER_END_REGEX.match(line, position)
+                end = match.end() if match else len(line)
+                parts.append(line[position:end])
+            elif state == "$$":
+                found = line.find("$$", position)
+                end = found + 2 if found >= 0 else len(line)
+                parts.append(line[position:end])
+                match = found >= 0
+            elif state == "/*":
+                found = line.find("*/", position)
+                end = found + 2 if found >= 0 else len(line)
+                match = found >= 0
+            else:
+                match = SQL_TOKEN_REGEX.search(line, position)
+                if match is None:
+                    parts.append(line[position:])
+                    break
+                token = match.group()
+                parts.append(line[position:match.start()])
+                position = match.end()
+                if token == ";":
+                    statement = ("".join(parts) + ";").strip()
+                    parts = []
+                    if statement != ";":
+                        yield statement, PUT_GET_REGEX.match(statement) is not None
+                elif token in ("--", "//"):
+                    # Line comments run to the end of the line; the line break stays
+                    parts.append("\n" if line.endswith("\n") else "")
+                    break
+                elif token == "/*":
+                    parts.append(" ")
+                    state = token
+                else:
+                    parts.append(token)
+                    state = token
+                continue
+
+            position = end
+            if match:
+                state = None
+
+    statement = "".join(parts).strip()
+    if statement:
+        yield statement, PUT_GET_REGEX.match(statement) is not None
+
+
+class DcrValidationError(ValueError):
+    """
+    Raised by SnowflakeDcr.validate when a prepared plan can't run; errors holds one message per problem
+    """
+    def __init__(self, errors):
+        super().__init__("Plan failed validation:\n  " + "\n  ".join(errors))
+        self.errors = errors
+
+
+class SubstitutionEngine:
+    """
+    A check_words/replace_words map applied in list order to blocks of whole lines
+
+    Each pair is one str.replace over a block of up to block_size characters, which gives the same text as running
+    every pair over each line on its own, with one call per pair per block instead of per line. Maps with a check word
+    that is empty or spans lines are applied line by line, since a block would change what they match.
+
+    replacements holds what one occurrence of each check word ends up as once the pairs listed after it have run.
+    """
+    block_size = 1024 * 1024
+
+    def __init__(self, check_words, replace_words):
+        self.pairs = list(zip(check_words or [], replace_words or []))
+        self.is_blockwise = all(check and "\n" not in check for check, _ in self.pairs)
+        self.replacements = {}
+        for index, (check, replace) in enumerate(self.pairs):
+            if check not in self.replacements:
+                self.replacements[check] = self._replace_ordered(replace, self.pairs[index + 1:])
+
+    def substitute(self, text):
+        """
+        Applies every replacement to text
+        """
+        return self._replace_ordered(text, self.pairs)
+
+    def substitute_lines(self, lines):
+        """
+        Applies every replacement to an iterable of lines, yielding blocks of whole lines
+        """
+        if not self.is_blockwise:
+            for line in lines:
+                yield self._replace_ordered(line, self.pairs)
+            return
+
+        block = []
+        block_length = 0
+        for line in lines:
+            block.append(line)
+            block_length += len(line)
+            if block_length >= self.block_size:
+                yield self._replace_ordered("".join(block), self.pairs)
+                block = []
+                block_length = 0
+        if block:
+            yield self._replace_ordered("".join(block), self.pairs)
+
+    @staticmethod
+    def _replace_ordered(text, pairs):
+        for check, replace in pairs:
+            text = text.replace(check, replace)
+        return text
+
+
+class RenderCache:
+    """
+    A content-addressed store of prepared scripts
+
+    Entries are keyed by a hash of the template bytes plus the ordered check_words/replace_words pairs, so a script is
+    only rendered again when one of them changes. Entries unused for max_age seconds are evicted, then the least
+    recently used entries until the cache fits in max_bytes.
+    """
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024, max_age=7 * 24 * 60 * 60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._counted = set()
+        self._lock = threading.Lock()
+
+    def key(self, original_script, pairs):
+        """
+        Returns the cache key for a template file rendered with a list of (check, replace) pairs
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps(pairs).encode("utf-8"))
+        with open(original_script, "rb") as fin:
+            for chunk in iter(lambda: fin.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the path of a cached artifact, or None on a miss
+
+        Each key is counted once per run, so an entry rendered during validation is not counted again as a hit when
+        the script is executed.
+        """
+        cached = self._path(key)
+        with self._lock:
+            is_counted = key not in self._counted
+            self._counted.add(key)
+            if os.path.exists(cached):
+                if is_counted:
+                    self.hits += 1
+                os.utime(cached)
+                return cached
+            if is_counted:
+                self.misses += 1
+            return None
+
+    def put(self, key, prepared_script, move=False):
+        """
+        Stores a copy of a prepared script under key and returns the path of the copy
+
+        move renames prepared_script into the cache instead of copying it; it should be a temp_path of this cache
+        """
+        if move:
+            os.replace(prepared_script, self._path(key))
+            return self._path(key)
+        temp_path = self.temp_path(key)
+        shutil.copyfile(prepared_script, temp_path)
+        os.replace(temp_path, self._path(key))
+        return self._path(key)
+
+    def temp_path(self, key):
+        """
+        Returns a path in the cache directory to write an entry for key to before moving it in with put
+        """
+        os.makedirs(self._directory(), exist_ok=True)
+        return self._path(key) + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+
+    def evict(self):
+        """
+        Removes entries that are too old, then the least recently used ones until the cache fits in max_bytes
+        """
+        entries = []
+        # Entries being written by a reader that never finished are left behind as .tmp files
+        for cached in glob.glob(os.path.join(self._directory(), "*.sql")) + \
+                glob.glob(os.path.join(self._directory(), "*.tmp")):
+            try:
+                stat = os.stat(cached)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, cached))
+
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, cached in sorted(entries):
+            if now - mtime > self.max_age or total > self.max_bytes:
+                try:
+                    os.remove(cached)
+                except OSError:
+                    continue
+                total -= size
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self._counted.clear()
+
+    def _directory(self):
+        return self.directory or os.path.join(os.getcwd(), ".dcr_cache")
+
+    def _path(self, key):
+        return os.path.join(self._directory(), key + ".sql")
+
+
+class RenderedStream(io.TextIOBase):
+    """
+    A read-only file-like view over rendered text blocks, so a script can be handed to execute_stream without first
+    being written to disk
+
+    Blocks are pulled only as the reader asks for more lines. Each block is also written to side_output when one is
+    given, and on_complete is called once the last block has been read.
+    """
+    def __init__(self, blocks, side_output=None, on_complete=None):
+        self._blocks = iter(blocks)
+        self._buffer = ""
+        self._position = 0
+        self._side_output = side_output
+        self._on_complete = on_complete
+
+    def readable(self):
+        return True
+
+    def readline(self, size=-1):
+        while True:
+            end = self._buffer.find("\n", self._position)
+            if end != -1 and (size < 0 or end - self._position < size):
+                line = self._buffer[self._position:end + 1]
+                break
+            if size >= 0 and len(self._buffer) - self._position >= size:
+                line = self._buffer[self._position:self._position + size]
+                break
+            if not self._fill():
+                line = self._buffer[self._position:]
+                break
+        self._position += len(line)
+        return line
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) - self._position < size:
+            if not self._fill():
+                break
+        end = len(self._buffer) if size < 0 else self._position + size
+        text = self._buffer[self._position:end]
+        self._position += len(text)
+        return text
+
+    def close(self):
+        if self._side_output is not None:
+            self._side_output.close()
+        super().close()
+
+    def _fill(self):
+        """
+        Moves the next block into the buffer, returning False once every block has been read
+        """
+        if self._blocks is None:
+            return False
+        block = next(self._blocks, None)
+        if block is None:
+            self._blocks = None
+            if self._side_output is not None:
+                self._side_output.close()
+            if self._on_complete is not None:
+                self._on_complete()
+            return False
+
+        if self._side_output is not None:
+            self._side_output.write(block)
+        self._buffer = self._buffer[self._position:] + block
+        self._position = 0
+        return True
+
+
+class StatementJournal:
+    """
+    An append-only JSONL record of every statement run, used to resume interrupted deployments
+
+    Each line holds the script, the plan it ran for, statement index, a hash of the rendered statement, the query id
+    and the status. The latest line for a script, plan and index wins, so deployments of the same templates to other
+    accounts, or with other substitutions, never read each other's results.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, script, index, statement_hash, query_id, status, error=None, plan=None):
+        """
+        Appends one statement result to the journal
+        """
+        entry = {"time": time.time(), "script": script, "plan": plan, "index": index, "hash": statement_hash,
+                 "query_id": query_id, "status": status, "error": error}
+        with self._lock:
+            with open(self._path(), "a", encoding='utf-8') as fout:
+                fout.write(json.dumps(entry) + "\n")
+
+    def succeeded(self, script, plan=None):
+        """
+        Returns {statement index: statement hash} for statements of a script and plan whose latest run succeeded
+        """
+        latest = {}
+        if not os.path.exists(self._path()):
+            return latest
+
+        with self._lock:
+            with open(self._path(), "r", encoding='utf-8') as fin:
+                for line in fin:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A run killed mid-write leaves a partial last line
+                        continue
+                    if entry["script"] == script and entry.get("plan") == plan:
+                        latest[entry["index"]] = entry
+
+        return {index: entry["hash"] for index, entry in latest.items() if entry["status"] == "succeeded"}
+
+    @staticmethod
+    def statement_hash(statement):
+        return hashlib.sha256(statement.encode("utf-8")).hexdigest()
+
+    def _path(self):
+        return self.path or os.path.join(os.getcwd(), "dcr_journal.jsonl")
+
+
+class TraceCollector:
+    """
+    Records timings from SnowflakeDcr hooks: render time per script, latency per statement, rows returned and query ids
+
+    Attach with collector.attach(dcr), then export with write_chrome_trace or print the slowest statements with
+    print_summary
+    """
+    def __init__(self):
+        self.events = []
+        self.statements = []
+        self._lock = threading.Lock()
+
+    def attach(self, dcr):
+        """
+        Subscribes the collector to every event of a SnowflakeDcr
+        """
+        dcr.subscribe("run_end", self._on_run)
+        dcr.subscribe("run_error", self._on_run)
+        dcr.subscribe("script_end", self._on_script)
+        dcr.subscribe("script_error", self._on_script)
+        dcr.subscribe("statement_end", self._on_statement)
+        dcr.subscribe("statement_error", self._on_statement)
+        dcr.subscribe("render", self._on_render)
+
+    def to_chrome_trace(self):
+        """
+        Returns the recorded spans in Chrome trace-event format
+        """
+        with self._lock:
+            return {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path):
+        """
+        Writes the trace as JSON, viewable in chrome://tracing or Perfetto
+        """
+        with open(path, "w", encoding='utf-8') as fout:
+            json.dump(self.to_chrome_trace(), fout)
+
+    def slowest(self, n=10):
+        """
+        Returns the n slowest statements, slowest first
+        """
+        with self._lock:
+            return sorted(self.statements, key=lambda statement: -statement["duration"])[:n]
+
+    def print_summary(self, n=10):
+        print("Slowest statements:")
+        for statement in self.slowest(n):
+            print("%8.3fs  %s #%d  %s  %s" % (statement["duration"], statement["script"], statement["index"],
+                                              statement["query_id"], statement["statement"][:80].replace("\n", " ")))
+
+    def _add(self, name, category, start, duration, args):
+        event = {"name": name, "cat": category, "ph": "X", "ts": start * 1000000, "dur": duration * 1000000,
+                 "pid": os.getpid(), "tid": threading.get_ident(), "args": args}
+        with self._lock:
+            self.events.append(event)
+
+    def _on_run(self, mode, start, duration, error=None):
+        self._add("run " + mode, "run", start, duration, {"error": repr(error) if error else None})
+
+    def _on_script(self, script, start, duration, error=None):
+        self._add(script, "script", start, duration, {"error": repr(error) if error else None})
+
+    def _on_render(self, script, start, duration, cached):
+        self._add("render " + script, "render", start, duration, {"cached": cached})
+
+    def _on_statement(self, script, index, statement, start, duration, query_id=None, rows=None, error=None):
+        record = {"script": script, "index": index, "statement": statement, "duration": duration,
+                  "query_id": query_id, "rows": rows, "error": repr(error) if error else None}
+        with self._lock:
+            self.statements.append(record)
+        self._add(script + " #" + str(index), "statement", start, duration,
+                  {"query_id": query_id, "rows": rows, "error": record["error"]})
+
+
+class CountSink:
+    """
+    A result sink that keeps only the row count of each statement, without fetching any rows
+    """
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def consume(self, script, index, cur):
+        with self._lock:
+            self.statements += 1
+            self.rows += cur.rowcount or 0
+
+
+class HeadSink:
+    """
+    A result sink that prints each statement and at most its first n rows
+    """
+    def __init__(self, n=10):
+        self.n = n
+
+    def consume(self, script, index, cur):
+        print(cur.query)
+        rows = cur.fetchmany(self.n) if self.n else []
+        for ret in rows:
+            print(ret)
+        if cur.rowcount is not None and cur.rowcount > len(rows):
+            print("... " + str(cur.rowcount - len(rows)) + " more rows")
+
+
+class FileSink:
+    """
+    A result sink that streams every result set to its own file under directory, batch_size rows at a time
+
+    format "csv" writes <script>-<index>.csv with a header row. format "arrow" writes <script>-<index>.arrow as an
+    Arrow IPC file when the cursor offers fetch_arrow_batches and pyarrow is installed, and falls back to CSV otherwise
+    and for empty results, so every result set leaves a file
+    """
+    def __init__(self, directory, batch_size=10000, format="csv"):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.format = format
+        os.makedirs(directory, exist_ok=True)
+
+    def consume(self, script, index, cur):
+        base_path = os.path.join(self.directory, script + "-" + str(index))
+        if self.format == "arrow" and hasattr(cur, "fetch_arrow_batches") and self._write_arrow(base_path, cur):
+            return
+
+        with open(base_path + ".csv", "w", encoding='utf-8', newline='') as fout:
+            writer = csv.writer(fout)
+            if getattr(cur, "description", None):
+                writer.writerow([column[0] for column in cur.description])
+            while True:
+                rows = cur.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                writer.writerows(rows)
+
+    @staticmethod
+    def _write_arrow(base_path, cur):
+        try:
+            import pyarrow
+        except ImportError:
+            return False
+
+        writer = None
+        try:
+            for batch in cur.fetch_arrow_batches():
+                if writer is None:
+                    writer = pyarrow.ipc.new_file(base_path + ".arrow", batch.schema)
+                writer.write_table(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+        # An empty result has no batches to take a schema from; the caller writes it as CSV with its header instead
+        return writer is not None
+
+
+class LocalFingerprintStore:
+    """
+    Keeps statement fingerprints for incremental runs in a local JSON file, standing in for the state table in tests
+    and dry runs
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self, script_conn, script):
+        with self._lock:
+            return set(self._read().get(script, []))
+
+    def save(self, script_conn, script, fingerprints):
+        with self._lock:
+            state = self._read()
+            state[script] = sorted(set(fingerprints))
+            temp_path = self._path() + "." + str(os.getpid()) + ".tmp"
+            with open(temp_path, "w", encoding='utf-8') as fout:
+                json.dump(state, fout)
+            os.replace(temp_path, self._path())
+
+    def _read(self):
+        if not os.path.exists(self._path()):
+            return {}
+        with open(self._path(), "r", encoding='utf-8') as fin:
+            return json.load(fin)
+
+    def _path(self):
+        return self.path or os.path.join(os.getcwd(), "dcr_fingerprints.json")
+
+
+class SnowflakeFingerprintStore:
+    """
+    Keeps statement fingerprints for incremental runs in a state table in the target account
+
+    The table (and its database and schema) is created on first use. It is read and written on the script's own
+    session through fully qualified names, as role when one is given (otherwise the role the session has at the time),
+    and the session's role, database and schema are put back afterwards so the script's statements run in the
+    context they set up. Only a session with no current database yet is left in the state table's schema.
+    """
+    def __init__(self, table="DCR_DEPLOY_STATE.PUBLIC.STATEMENT_FINGERPRINTS", role=None):
+        self.table = table
+        self.role = role
+        self._ready = set()
+        self._lock = threading.Lock()
+
+    def load(self, script_conn, script):
+        cur, saved_context = self._open(script_conn)
+        try:
+            cur.execute("select fingerprint from " + self.table + " where script = %s", (script,))
+            return set(row[0] for row in cur.fetchall())
+        finally:
+            self._restore(cur, saved_context)
+
+    def save(self, script_conn, script, fingerprints):
+        cur, saved_context = self._open(script_conn)
+        try:
+            cur.execute("delete from " + self.table + " where script = %s", (script,))
+            if fingerprints:
+                cur.executemany("insert into " + self.table + " (script, fingerprint) values (%s, %s)",
+                                [(script, fingerprint) for fingerprint in sorted(set(fingerprints))])
+        finally:
+            self._restore(cur, saved_context)
+
+    def _open(self, script_conn):
+        """
+        Returns a new cursor on the script's session switched to role, with the table created if needed, and the
+        (role, database, schema) to put back afterwards, with None for the parts left unchanged
+        """
+        cur = script_conn.cursor()
+        cur.execute("select current_role(), current_database(), current_schema()")
+        role, database, schema = cur.fetchone()
+        saved_context = (None, None, None)
+        if self.role is not None:
+            cur.execute("use role " + self.role)
+            saved_context = (role, None, None)
+
+        with self._lock:
+            if id(script_conn) not in self._ready:
+                parts = self.table.split(".")
+                if len(parts) == 3:
+                    # Creating a database or schema makes it the current one
+                    cur.execute("create database if not exists " + parts[0])
+                    cur.execute("create schema if not exists " + parts[0] + "." + parts[1])
+                    saved_context = (saved_context[0], database, schema)
+                cur.execute("create table if not exists " + self.table + " (script string, fingerprint string, "
+                            "deployed_at timestamp_ltz default current_timestamp())")
+                self._ready.add(id(script_conn))
+        return cur, saved_context
+
+    @staticmethod
+    def _restore(cur, saved_context):
+        """
+        Puts back the role, database and schema the session had before _open
+        """
+        role, database, schema = (None if name is None else '"' + name.replace('"', '""') + '"'
+                                  for name in saved_context)
+        if role:
+            cur.execute("use role " + role)
+        if database:
+            cur.execute("use database " + database)
+            if schema:
+                cur.execute("use schema " + database + "." + schema)
+
+
+class CachedResult:
+    """
+    A cursor-like result for a probe statement answered from cached session facts, with no query id
+    """
+    def __init__(self, query, columns, row):
+        self.query = query
+        self.sfqid = None
+        self.rowcount = 1
+        self.description = [(column,) for column in columns]
+        self._rows = iter([row])
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=1):
+        return list(itertools.islice(self._rows, size))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        self._rows = iter(())
+
+    def __iter__(self):
+        return self._rows
+
+
+class SessionPool:
+    """
+    Pools Snowflake sessions keyed by account, role and warehouse, so repeated and concurrent runs reuse logged-in
+    sessions instead of connecting again
+
+    connect is called as connect(account=..., role=..., warehouse=..., **connect_args) and defaults to
+    snowflake.connector.connect. Sessions idle for longer than idle_timeout seconds are closed, and a session idle for
+    longer than check_after seconds is checked with a trivial query before it is handed out again. The SESSION_FACTS
+    of a session are fetched in one query the first time a probe statement needs them and kept up to date as USE
+    ROLE and USE WAREHOUSE statements run, so later probes need no round-trip. Creating or dropping a warehouse
+    drops them, so they are fetched again.
+    """
+    def __init__(self, connect=None, idle_timeout=600, check_after=60, **connect_args):
+        self.connect = connect
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.connect_args = connect_args
+        self.connects = 0
+        self.reuses = 0
+        self.answered = 0
+        self._idle = {}
+        self._in_use = {}
+        self._facts = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, account, role=None, warehouse=None):
+        """
+        Returns a healthy session for account, role and warehouse, reusing an idle one when there is one
+        """
+        key = (account.lower(), role.upper() if role else None, warehouse.upper() if warehouse else None)
+        self.evict_idle()
+        while True:
+            with self._lock:
+                if not self._idle.get(key):
+                    break
+                conn, released = self._idle[key].pop()
+            if self._restore(conn, key, role, warehouse, time.monotonic() - released):
+                with self._lock:
+                    self._in_use[id(conn)] = (key, conn)
+                    self.reuses += 1
+                return conn
+            self._discard(conn)
+
+        connect = self.connect
+        if connect is None:
+            import snowflake.connector
+            connect = snowflake.connector.connect
+        connect_args = dict(self.connect_args, account=account)
+        if role:
+            connect_args["role"] = role
+        if warehouse:
+            connect_args["warehouse"] = warehouse
+        conn = connect(**connect_args)
+        with self._lock:
+            self._in_use[id(conn)] = (key, conn)
+            self.connects += 1
+        return conn
+
+    def release(self, conn):
+        """
+        Returns a session from acquire to the pool
+        """
+        with self._lock:
+            key, _ = self._in_use.pop(id(conn), (None, None))
+            if key is not None:
+                self._idle.setdefault(key, []).append((conn, time.monotonic()))
+
+    def evict_idle(self):
+        """
+        Closes sessions that have been idle for longer than idle_timeout
+        """
+        expired = []
+        with self._lock:
+            cutoff = time.monotonic() - self.idle_timeout
+            for key, sessions in self._idle.items():
+                expired.extend(conn for conn, released in sessions if released < cutoff)
+                sessions[:] = [(conn, released) for conn, released in sessions if released >= cutoff]
+        for conn in expired:
+            self._discard(conn)
+
+    def close(self):
+        """
+        Closes every idle session; sessions still in use are closed when they are released and evicted
+        """
+        with self._lock:
+            sessions = [conn for idle in self._idle.values() for conn, _ in idle]
+            self._idle = {}
+        for conn in sessions:
+            self._discard(conn)
+
+    def session_facts(self, conn):
+        """
+        Returns {fact: value} for the SESSION_FACTS of a pooled session, querying them the first time
+        """
+        facts = self._facts.get(id(conn))
+        if facts is None:
+            cur = conn.cursor()
+            cur.execute("select " + ", ".join(fact + "()" for fact in SESSION_FACTS))
+            facts = dict(zip(SESSION_FACTS, cur.fetchone() or ()))
+            self._facts[id(conn)] = facts
+        return facts
+
+    def answer(self, conn, statement):
+        """
+        Returns a CachedResult for a probe statement on a pooled session, or None when it has to be sent
+        """
+        match = PROBE_REGEX.match(statement)
+        if match is None or id(conn) not in self._in_use:
+            return None
+        columns = re.findall(r"current_[a-z]+", match.group("columns"), re.IGNORECASE)
+        facts = self.session_facts(conn)
+        if any(column.lower() not in facts for column in columns):
+            return None
+        self.answered += 1
+        return CachedResult(statement, [column.upper() + "()" for column in columns],
+                            tuple(facts[column.lower()] for column in columns))
+
+    def observe(self, conn, statement):
+        """
+        Updates the cached facts of a session after statement ran on it
+        """
+        facts = self._facts.get(id(conn))
+        if facts is None:
+            return
+        match = USE_CONTEXT_REGEX.match(statement)
+        if WAREHOUSE_CHANGE_REGEX.match(statement) or (match is not None and match.group("name") is None):
+            del self._facts[id(conn)]
+        elif match is not None:
+            facts["current_" + match.group("kind").lower()] = _object_parts(match.group("name"))[0]
+
+    def _restore(self, conn, key, role, warehouse, idle_seconds):
+        """
+        Checks an idle session and switches it back to the role and warehouse it was pooled under, returning False
+        when it can't be used
+        """
+        try:
+            if getattr(conn, "is_closed", None) is not None and conn.is_closed():
+                return False
+            facts = self._facts.get(id(conn), {})
+            statements = []
+            if role and facts.get("current_role") != key[1]:
+                statements.append("use role " + role)
+            if warehouse and facts.get("current_warehouse") != key[2]:
+                statements.append("use warehouse " + warehouse)
+            if not statements and idle_seconds > self.check_after:
+                statements.append("select 1")
+            for statement in statements:
+                conn.cursor().execute(statement)
+                self.observe(conn, statement)
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, conn):
+        self._facts.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+class DcrBundle:
+    """
+    A prepared plan compiled by SnowflakeDcr.compile_bundle, with every script already split into statements made of
+    literal segments and numbered slots, one slot per distinct check word
+
+    The file is BUNDLE_MAGIC, the manifest length as 8 bytes, the JSON manifest, then every literal segment once. The
+    manifest holds the plan's check_words, script_list and dependencies, each script's role (provider or consumer),
+    template hash and statements, the text around each slot, and a hash of the segments. Segments are read through a
+    memory map, so loading a bundle costs little more than parsing its manifest.
+    """
+    def __init__(self, manifest, segments, resources=()):
+        self.manifest = manifest
+        self.check_words = manifest["check_words"]
+        self.script_list = manifest["script_list"]
+        self.script_dependencies = manifest["dependencies"]
+        self.roles = dict((script["name"], script["role"]) for script in manifest["scripts"])
+        self._scripts = dict((script["name"], script) for script in manifest["scripts"])
+        self._segments = segments
+        self._resources = resources
+        self._parts = {}
+
+    @classmethod
+    def load(cls, bundle_path, verify=True):
+        """
+        Memory-maps a bundle file, checking the hash of its segments unless verify is False
+        """
+        with open(bundle_path, "rb") as fin:
+            mapped = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        start = len(BUNDLE_MAGIC) + 8
+        if mapped[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            mapped.close()
+            raise ValueError("Not a DCR bundle: " + bundle_path)
+
+        manifest_length = struct.unpack(">Q", mapped[len(BUNDLE_MAGIC):start])[0]
+        manifest = json.loads(mapped[start:start + manifest_length].decode("utf-8"))
+        segments = memoryview(mapped)[start + manifest_length:]
+        if verify and hashlib.sha256(segments).hexdigest() != manifest["segments_sha256"]:
+            segments.release()
+            mapped.close()
+            raise ValueError("Bundle segments don't match their hash: " + bundle_path)
+        return cls(manifest, segments, (mapped,))
+
+    def close(self):
+        self._parts = {}
+        if isinstance(self._segments, memoryview):
+            self._segments.release()
+        for resource in self._resources:
+            resource.close()
+
+    def statements(self, script, slot_values):
+        """
+        Yields (statement, is_put_or_get) for a script with every slot filled from slot_values, as split_sql would
+        for the rendered template
+        """
+        parts = self._parts.get(script)
+        if parts is None:
+            parts = []
+            for encoded in self._scripts[script]["statements"]:
+                # Literal segments are (offset, length) pairs and slots are stored as -(slot + 1)
+                statement = []
+                position = 0
+                while position < len(encoded):
+                    if encoded[position] < 0:
+                        statement.append(-encoded[position] - 1)
+                        position += 1
+                    else:
+                        offset, length = encoded[position:position + 2]
+                        statement.append(bytes(self._segments[offset:offset + length]).decode("utf-8"))
+                        position += 2
+                parts.append(statement)
+            self._parts[script] = parts
+
+        for statement in parts:
+            text = "".join(part if isinstance(part, str) else slot_values[part] for part in statement)
+            yield text, PUT_GET_REGEX.match(text) is not None
+
+    def slot_values(self, substitution):
+        """
+        Returns the value of each slot for a plan's SubstitutionEngine
+
+        Raises ValueError when the plan has different check words, or when a value could make the filled statements
+        differ from rendering the templates: values containing quotes, statement ends or comment markers would split
+        differently, and values that join the text around a slot into another check word would be replaced again
+        """
+        if [check for check, _ in substitution.pairs] != self.check_words:
+            raise ValueError("Bundle was compiled for check words " + ", ".join(self.check_words))
+
+        values = [substitution.replacements[check] for check in self.manifest["slots"]]
+        for check, value in zip(self.manifest["slots"], values):
+            if UNSAFE_SLOT_VALUE_REGEX.search(value):
+                raise ValueError("Replacement for " + check + " can't be filled into a bundle: " + repr(value))
+
+        for fragment in self.manifest["contexts"]:
+            filled = "".join(part if index % 2 == 0 else substitution.replacements[part]
+                             for index, part in enumerate(fragment))
+            if SubstitutionEngine._replace_ordered("".join(fragment), substitution.pairs) != filled:
+                raise ValueError("Replacements change the text around " + repr("".join(fragment)) +
+                                 " differently from the templates; prepare and execute without the bundle")
+        return values
 
 
 class SnowflakeDcr:
@@ -20,6 +1100,108 @@ class SnowflakeDcr:
         self.script_conn_list = None
         self.check_words = None
         self.replace_words = None
+        self.substitution = None
+        self.script_dependencies = None
+        self.output_prefix = ""
+        # Each run writes its prepared scripts to a new workspace under output_directory, and the oldest finished
+        # workspaces beyond keep_runs are removed when a run starts; None keeps them all
+        self.output_directory = "output"
+        self.keep_runs = 10
+        self.workspace = None
+        self.render_cache = RenderCache()
+        self.is_streaming = False
+        self.write_prepared = False
+        self.journal = StatementJournal()
+        self.is_resuming = False
+        self.is_incremental = False
+        self.fingerprint_store = SnowflakeFingerprintStore()
+        self.max_in_flight = 1
+        self.is_validating = True
+        # Set by replay_bundle; scripts then run from the compiled bundle instead of the templates under path
+        self.bundle = None
+        self._slot_values = None
+        # Statements per request and request size in batch mode; batch_size > 1 takes precedence over max_in_flight
+        self.batch_size = 1
+        self.batch_max_bytes = 1024 * 1024
+        # Any object with consume(script, index, cursor) can receive statement results
+        self.result_sink = HeadSink()
+        # Set to a SessionPool to pass None for a connection and have prepare_ methods get a session for the account
+        self.session_pool = None
+        self._sessions = {}
+        # Journal plan id of each script being run, see _journal_plan
+        self._journal_plans = {}
+        self.fleet = None
+        self.fleet_shared_scripts = None
+        self.provider_conn = None
+        self.subscribers = {}
+        self._run_start = None
+        self._run_mode = None
+
+    def subscribe(self, event, callback):
+        """
+        Calls callback with keyword details every time event fires; see HOOK_EVENTS for the events
+        """
+        if event not in HOOK_EVENTS:
+            raise ValueError("Unknown event " + event)
+        self.subscribers.setdefault(event, []).append(callback)
+
+    def unsubscribe(self, event, callback):
+        self.subscribers.get(event, []).remove(callback)
+
+    def _emit(self, event, **details):
+        for callback in self.subscribers.get(event, ()):
+            callback(**details)
+
+    def release_sessions(self):
+        """
+        Returns the sessions prepare_ methods took from session_pool, including those of fleet members
+        """
+        for conn in self._sessions.values():
+            self.session_pool.release(conn)
+        self._sessions = {}
+        for _, member in self.fleet or ():
+            member.release_sessions()
+
+    def _copy_settings(self, member):
+        """
+        Gives a fleet member the same EXECUTION_SETTINGS as this object
+        """
+        for name in EXECUTION_SETTINGS:
+            setattr(member, name, getattr(self, name))
+
+    def _session(self, account, conn):
+        """
+        Returns conn, or when it is None a session for account from session_pool, kept until release_sessions
+        """
+        if conn is not None or self.session_pool is None:
+            return conn
+        if account.lower() not in self._sessions:
+            self._sessions[account.lower()] = self.session_pool.acquire(account)
+        return self._sessions[account.lower()]
+
+    def _set_plan(self, is_debug_mode, path, script_list, script_conn_list, check_words, replace_words,
+                  script_dependencies=None):
+        """
+        Stores a prepared plan and compiles its substitution map
+
+        script_dependencies maps a script to the scripts it must wait for; scripts not listed wait for the script
+        before them in script_list
+        """
+        dependencies = {}
+        for index, script in enumerate(script_list):
+            dependencies[script] = script_list[index - 1:index] if index > 0 else []
+        dependencies.update(script_dependencies or {})
+
+        self.is_debug_mode = is_debug_mode
+        self.path = path
+        self.script_list = script_list
+        self.script_conn_list = script_conn_list
+        self.check_words = check_words
+        self.replace_words = replace_words
+        self.substitution = SubstitutionEngine(check_words, replace_words)
+        self.script_dependencies = dependencies
+        self.bundle = None
+        self._slot_values = None
 
     def execute_locally(self):
         """
@@ -28,43 +1210,1000 @@ class SnowflakeDcr:
         if self.is_debug_mode is None or self.path is None or self.script_list is None:
             print("Run a prepare script first!")
         else:
-            # Clean up old files
-            files = glob.glob(os.getcwd() + "/output/*")
-            for f in files:
-                os.remove(f)
-
-            # Prepare scripts
-            comment_code_regex = re.compile(r"(?<!:)//.*")
-
-            for current_script in self.script_list:
-                print("Starting " + current_script)
-                original_script = self.path + current_script + ".sql"
-                prepared_script = "output/" + current_script + "-prepared.sql"
-                script_index = self.script_list.index(current_script)
-                script_conn = self.script_conn_list[script_index]
-
-                with open(original_script, "r", encoding='utf-8') as fin:
-                    with open(prepared_script, "w", encoding='utf-8') as fout:
-                        for line in fin:
-                            # Prepare temp file
-                            for check, replace in zip(self.check_words, self.replace_words):
-                                line = line.replace(check, replace)
-
-                            # Remove commented SQL lines due to finicky execute_stream behavior
-                            line = re.sub(comment_code_regex, '', line)
-
-                            fout.write(line)
-
-                if not self.is_debug_mode:
-                    print("Running statements for " + current_script)
-                    with open(prepared_script, "r", encoding='utf-8') as fout:
+            self._start_run("locally")
+
+            try:
+                if self.is_validating and not self.is_debug_mode:
+                    self.validate()
+                for current_script in self.script_list:
+                    self._execute_script(current_script)
+                if self.is_validating and self.is_debug_mode:
+                    self.validate(is_prepared=True)
+            except Exception as e:
+                self._end_run(e)
+                raise
+
+            self._end_run()
+
+    def execute_parallel(self):
+        """
+        Runs the same scripts as execute_locally, starting each script as soon as the scripts it depends on finish
+
+        Every connection gets one worker lane, so scripts on the provider and consumer sessions overlap while scripts
+        sharing a session still run one at a time
+        """
+        if self.is_debug_mode is None or self.path is None or self.script_list is None:
+            print("Run a prepare script first!")
+            return
+
+        self._start_run("parallel")
+        if self.is_validating and not self.is_debug_mode:
+            try:
+                self.validate()
+            except Exception as e:
+                self._end_run(e)
+                raise
+
+        lanes = {}
+        for script_conn in self.script_conn_list:
+            if id(script_conn) not in lanes:
+                lanes[id(script_conn)] = ThreadPoolExecutor(max_workers=1)
+
+        finished = set()
+        running = {}
+        waiting = list(self.script_list)
+        error = None
+        try:
+            while waiting or running:
+                if error is None:
+                    for current_script in list(waiting):
+                        if all(dependency in finished for dependency in self.script_dependencies[current_script]):
+                            waiting.remove(current_script)
+                            script_conn = self.script_conn_list[self.script_list.index(current_script)]
+                            future = lanes[id(script_conn)].submit(self._execute_script, current_script)
+                            running[future] = current_script
+                    if not running:
+                        raise ValueError("Script dependencies cannot be satisfied: " + ", ".join(waiting))
+                elif not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    current_script = running.pop(future)
+                    if future.exception() is not None:
+                        if error is None:
+                            error = future.exception()
+                            print("Failed " + current_script + ", waiting for running scripts to finish")
+                    else:
+                        finished.add(current_script)
+        finally:
+            for lane in lanes.values():
+                lane.shutdown()
+
+        if error is None and self.is_validating and self.is_debug_mode:
+            self.validate(is_prepared=True)
+        self._end_run(error)
+        if error is not None:
+            raise error
+
+    def execute_fleet(self, max_workers=4):
+        """
+        Runs a plan from prepare_consumer_fleet and returns a summary per consumer
+
+        Shared scripts run once; the remaining scripts run for up to max_workers consumers at a time, with scripts on
+        the provider connection taking turns because they change objects every consumer shares. A consumer that fails
+        is skipped for the rest of the run without stopping the others.
+        """
+        if self.fleet is None:
+            print("Run prepare_consumer_fleet first!")
+            return None
+
+        # Settings changed since prepare_consumer_fleet apply to this run too
+        for _, member in self.fleet:
+            self._copy_settings(member)
+        self._start_run("fleet")
+        if self.is_validating:
+            try:
+                for _, member in self.fleet:
+                    member.validate()
+            except Exception as e:
+                self._end_run(e)
+                raise
+        for _, member in self.fleet:
+            member.workspace = self.workspace
+
+        summary = {}
+        for consumer_account, _ in self.fleet:
+            summary[consumer_account] = {"status": "succeeded", "error": None, "scripts": []}
+
+        provider_lock = threading.Lock()
+        shared_member = self.fleet[0][1]
+
+        def run_scripts(consumer_account, member, scripts):
+            try:
+                for current_script in scripts:
+                    script_conn = member.script_conn_list[member.script_list.index(current_script)]
+                    if script_conn is self.provider_conn:
+                        with provider_lock:
+                            member._execute_script(current_script)
+                    else:
+                        member._execute_script(current_script)
+                    summary[consumer_account]["scripts"].append(current_script)
+            except Exception as e:
+                summary[consumer_account]["status"] = "failed"
+                summary[consumer_account]["error"] = repr(e)
+                print("Failed " + current_script + " for " + consumer_account + ": " + repr(e))
+
+        # Shared scripts split the plan into phases that every consumer finishes before the shared script runs
+        phase = []
+        for current_script in shared_member.script_list + [None]:
+            if current_script is not None and current_script not in self.fleet_shared_scripts:
+                phase.append(current_script)
+                continue
+
+            active = [(account, member) for account, member in self.fleet if summary[account]["status"] == "succeeded"]
+            if phase and active:
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    for consumer_account, member in active:
+                        pool.submit(run_scripts, consumer_account, member, phase)
+                # Consumers that failed during the phase take no part in the shared script
+                active = [(account, member) for account, member in active if summary[account]["status"] == "succeeded"]
+            phase = []
+
+            if current_script is not None and active:
+                saved_prefix = shared_member.output_prefix
+                shared_member.output_prefix = ""
+                try:
+                    shared_member._execute_script(current_script)
+                except Exception as e:
+                    for consumer_account, _ in active:
+                        summary[consumer_account]["status"] = "failed"
+                        summary[consumer_account]["error"] = repr(e)
+                    print("Failed shared script " + current_script + ": " + repr(e))
+                else:
+                    for consumer_account, _ in active:
+                        summary[consumer_account]["scripts"].append(current_script)
+                finally:
+                    shared_member.output_prefix = saved_prefix
+
+        for consumer_account, result in summary.items():
+            print(consumer_account + ": " + result["status"] + (" - " + result["error"] if result["error"] else ""))
+        self._end_run()
+        return summary
+
+    def validate(self, is_prepared=False):
+        """
+        Checks a prepared plan without sending anything, raising DcrValidationError for missing templates and
+        placeholders left unreplaced, and returns warnings for objects the plan uses but no earlier script creates
+
+        Each script is read from the render cache, rendering it into the cache on a miss so the run that follows
+        doesn't render it again, or from the bundle being replayed. In streaming mode a miss is rendered as a stream
+        and left for the run to write to the cache as it reads the script. is_prepared reads the prepared copies a
+        debug run has just written to the workspace instead. In debug mode errors are printed rather than raised,
+        since nothing is sent.
+
+        Placeholders are looked for outside the replacement values, in the PLACEHOLDER_FAMILIES the plan's check words
+        belong to. Fully qualified object names come from statement_accesses; one counts as created when an earlier
+        statement creates it, or creates the database or schema holding it from a share, an application or a clone,
+        which brings the objects inside along.
+        """
+        errors = []
+        warnings = []
+        families = [family for family in PLACEHOLDER_FAMILIES
+                    if any(re.fullmatch(family, check, re.IGNORECASE) for check in self.check_words)]
+        placeholder_regex = re.compile("|".join(families), re.IGNORECASE) if families else None
+        replacements = sorted(set(replace for replace in self.replace_words if replace), key=len, reverse=True)
+        replacement_regex = re.compile("|".join(re.escape(replace) for replace in replacements)) \
+            if replacements else None
+
+        created = {}
+        references = []
+        for current_script in self.script_list:
+            original_script = self.path + current_script + ".sql"
+            if self.bundle is None and not os.path.exists(original_script):
+                errors.append(current_script + ": template " + original_script + " not found")
+                continue
+
+            for index, (statement, _) in enumerate(self._validated_statements(current_script, is_prepared)):
+                if placeholder_regex is not None:
+                    unreplaced = statement
+                    if replacement_regex is not None:
+                        unreplaced = replacement_regex.sub("\0", unreplaced)
+                    for token in sorted(set(placeholder_regex.findall(unreplaced))):
+                        errors.append(current_script + " statement " + str(index) + ": unreplaced " + token)
+
+                accesses = statement_accesses(statement) or {}
+                masked = LITERAL_REGEX.sub("''", statement)
+                match = CREATE_REGEX.match(masked)
+                created_name = _object_parts(match.group("name")) if match else None
+                for name in accesses:
+                    if name != created_name and len(name) == 3:
+                        references.append((current_script, index, name, len(created)))
+                if created_name is not None and created_name not in created:
+                    created[created_name] = (current_script, len(created),
+                                             CREATE_WITH_CONTENTS_REGEX.search(masked) is not None)
+
+        for current_script, index, name, created_count in references:
+            if name[0] in SYSTEM_DATABASES or "INFORMATION_SCHEMA" in name:
+                continue
+            creators = [created[prefix] for prefix in (name[:1], name[:2]) if prefix in created and created[prefix][2]]
+            if name in created:
+                creators.append(created[name])
+            if any(order < created_count for _, order, _ in creators):
+                continue
+            label = current_script + " statement " + str(index) + ": " + ".".join(name)
+            if creators:
+                warnings.append(label + " is only created later, by " + creators[0][0])
+            else:
+                warnings.append(label + " is not created by any script in the plan")
+
+        for warning in warnings:
+            print("Validation warning: " + warning)
+        if errors and self.is_debug_mode:
+            for error in errors:
+                print("Validation error: " + error)
+        elif errors:
+            raise DcrValidationError(errors)
+        return warnings
+
+    def compile_bundle(self, bundle_path):
+        """
+        Compiles the prepared plan into a bundle file and returns it loaded as a DcrBundle
+
+        replay_bundle can then run the same plan for other accounts from the bundle, without reading or rendering
+        the templates again. Each template is checked to give exactly the statements execution would send.
+        """
+        if self.script_list is None:
+            print("Run a prepare script first!")
+            return None
+        if self.bundle is not None:
+            raise ValueError("This plan is replaying a bundle; prepare it again to compile from the templates")
+        if not self.substitution.is_blockwise:
+            raise ValueError("Empty check words and check words spanning lines can't be compiled into a bundle")
+        if self.is_validating:
+            self.validate()
+
+        # Longest check word first, so a slot never splits a longer check word
+        slots = sorted(self.substitution.replacements, key=len, reverse=True)
+        slot_regex = re.compile("(" + "|".join(re.escape(slot) for slot in slots) + ")")
+        window = len(slots[0]) if slots else 0
+        segments = io.BytesIO()
+        offsets = {}
+        contexts = set()
+        scripts = []
+        for current_script in self.script_list:
+            with open(self.path + current_script + ".sql", "r", encoding='utf-8') as fin:
+                template = fin.read()
+            parts = slot_regex.split(template) if slots else [template]
+
+            # Text around each run of close check words, for slot_values to check replacements against
+            for index in range(1, len(parts), 2):
+                if index == 1 or len(parts[index - 1]) >= window:
+                    first = index
+                if index + 2 >= len(parts) or len(parts[index + 1]) >= window:
+                    fragment = parts[first - 1:index + 2]
+                    fragment[0] = fragment[0][max(len(fragment[0]) - window + 1, 0):]
+                    fragment[-1] = fragment[-1][:window - 1]
+                    contexts.add(tuple(fragment))
+
+            marked = "".join(part if index % 2 == 0 else "\0" + str(slots.index(part)) + "\0"
+                             for index, part in enumerate(parts))
+            statements = []
+            for statement, _ in split_sql(io.StringIO(marked)):
+                encoded = []
+                for index, part in enumerate(SLOT_REGEX.split(statement)):
+                    if index % 2 == 1:
+                        encoded.append(-int(part) - 1)
+                    elif part:
+                        if part not in offsets:
+                            data = part.encode("utf-8")
+                            offsets[part] = (segments.tell(), len(data))
+                            segments.write(data)
+                        encoded.extend(offsets[part])
+                statements.append(encoded)
+
+            scripts.append({"name": current_script, "role": current_script.split("_")[0],
+                            "template_sha256": hashlib.sha256(template.encode("utf-8")).hexdigest(),
+                            "statements": statements})
+
+        data = segments.getvalue()
+        manifest = {"format": 1, "check_words": [check for check, _ in self.substitution.pairs], "slots": slots,
+                    "script_list": self.script_list, "dependencies": self.script_dependencies, "scripts": scripts,
+                    "contexts": sorted(contexts), "segments_sha256": hashlib.sha256(data).hexdigest()}
+        bundle = DcrBundle(manifest, data)
+
+        slot_values = bundle.slot_values(self.substitution)
+        for current_script in self.script_list:
+            if list(bundle.statements(current_script, slot_values)) != list(self._plan_statements(current_script)):
+                raise ValueError(current_script + " can't be compiled: its check words overlap, so replacing them "
+                                 "depends on list order")
+
+        header = json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+        temp_path = self._temp_path(bundle_path)
+        with open(temp_path, "wb") as fout:
+            fout.write(BUNDLE_MAGIC)
+            fout.write(struct.pack(">Q", len(header)))
+            fout.write(header)
+            fout.write(data)
+        os.replace(temp_path, bundle_path)
+        print("Compiled " + str(len(self.script_list)) + " scripts, " +
+              str(sum(len(script["statements"]) for script in scripts)) + " statements and " + str(len(slots)) +
+              " slots into " + bundle_path)
+        return DcrBundle.load(bundle_path)
+
+    def replay_bundle(self, bundle):
+        """
+        Makes the prepared plan run from a compiled bundle (a DcrBundle or a bundle path) instead of its templates
+
+        Call it after the same prepare_ method and dcr_version the bundle was compiled from, with this run's accounts
+        and connections; path is not read. The bundle's slots are filled by index with this plan's replacements.
+        """
+        if self.script_list is None:
+            print("Run a prepare script first!")
+            return
+        if not isinstance(bundle, DcrBundle):
+            bundle = DcrBundle.load(bundle)
+        if list(self.script_list) != bundle.script_list:
+            raise ValueError("Bundle was compiled for scripts " + ", ".join(bundle.script_list))
+        for role in set(bundle.roles.values()):
+            connections = set(id(script_conn) for current_script, script_conn in zip(self.script_list,
+                                                                                       self.script_conn_list)
+                              if bundle.roles[current_script] == role)
+            if len(connections) > 1:
+                raise ValueError("Bundle expects one connection for the " + role + " scripts")
+
+        self._slot_values = bundle.slot_values(self.substitution)
+        self.bundle = bundle
+
+    def _start_run(self, mode):
+        """
+        Resets per-run state and creates the run workspace before scripts are prepared
+        """
+        self.workspace = self._create_workspace()
+        if self.render_cache is not None:
+            self.render_cache.reset_stats()
+        self._run_start = time.perf_counter()
+        self._run_mode = mode
+        self._emit("run_start", mode=mode, start=self._run_start)
+
+    def _end_run(self, error=None):
+        """
+        Reports render cache and session pool usage, trims the cache, marks the workspace finished and fires the run
+        hooks
+        """
+        try:
+            os.remove(os.path.join(self.workspace, ".active"))
+        except OSError:
+            pass
+        if self.render_cache is not None:
+            print("Render cache: " + str(self.render_cache.hits) + " hits, " + str(self.render_cache.misses) +
+                  " misses")
+            self.render_cache.evict()
+        if self.session_pool is not None:
+            print("Session pool: " + str(self.session_pool.connects) + " connects, " +
+                  str(self.session_pool.reuses) + " reuses, " + str(self.session_pool.answered) + " probes answered")
+
+        duration = time.perf_counter() - self._run_start
+        if error is None:
+            self._emit("run_end", mode=self._run_mode, start=self._run_start, duration=duration)
+        else:
+            self._emit("run_error", mode=self._run_mode, start=self._run_start, duration=duration, error=error)
+
+    def _create_workspace(self):
+        """
+        Creates a uniquely named directory for this run's files, marked active until the run ends
+        """
+        os.makedirs(self.output_directory, exist_ok=True)
+        self._prune_workspaces()
+        workspace = tempfile.mkdtemp(prefix="run-" + time.strftime("%Y%m%d-%H%M%S") + "-", dir=self.output_directory)
+        open(os.path.join(workspace, ".active"), "w").close()
+        print("Run workspace: " + workspace)
+        return workspace
+
+    def _prune_workspaces(self):
+        """
+        Removes the oldest finished run workspaces beyond keep_runs
+
+        Workspaces of runs still going, in this or another process, are left alone unless their marker is over a day
+        old, which means the run died without finishing
+        """
+        if self.keep_runs is None:
+            return
+        finished = []
+        for workspace in glob.glob(os.path.join(self.output_directory, "run-*")):
+            marker = os.path.join(workspace, ".active")
+            try:
+                if os.path.exists(marker) and time.time() - os.path.getmtime(marker) < 24 * 60 * 60:
+                    continue
+                finished.append((os.path.getmtime(workspace), workspace))
+            except OSError:
+                continue
+        finished.sort()
+        for _, workspace in finished[:max(len(finished) - self.keep_runs, 0)]:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    def _prepared_path(self, current_script):
+        return os.path.join(self.workspace, self.output_prefix + current_script + "-prepared.sql")
+
+    @staticmethod
+    def _temp_path(path):
+        return path + "." + str(threading.get_ident()) + ".tmp"
+
+    def _execute_script(self, current_script):
+        """
+        Prepares one script and runs it on its connection unless in debug mode
+        """
+        print("Starting " + current_script)
+        script = self.output_prefix + current_script
+        start = time.perf_counter()
+        self._emit("script_start", script=script, start=start)
+
+        try:
+            if not self.is_debug_mode:
+                print("Running statements for " + current_script)
+                script_conn = self.script_conn_list[self.script_list.index(current_script)]
+                if self.bundle is not None:
+                    self._run_statements(current_script, script_conn,
+                                         self.bundle.statements(current_script, self._slot_values))
+                else:
+                    with self._open_script(current_script) as fout:
                         # Run script
-                        for cur in script_conn.execute_stream(fout, remove_comments=True):
-                            print(cur.query)
-                            for ret in cur:
-                                print(ret)
+                        self._run_statements(current_script, script_conn, split_sql(fout))
+            else:
+                self._prepare_script(current_script)
+                print("Debug mode: File generated but not run for " + current_script)
+        except Exception as e:
+            self._emit("script_error", script=script, start=start, duration=time.perf_counter() - start, error=e)
+            raise
+
+        self._emit("script_end", script=script, start=start, duration=time.perf_counter() - start)
+
+    def _run_statements(self, current_script, script_conn, statements):
+        for index, cur in self._execute_stream(current_script, script_conn, statements):
+            if self.result_sink is not None:
+                self.result_sink.consume(self.output_prefix + current_script, index, cur)
+
+    def _plan_statements(self, current_script):
+        """
+        Yields the (statement, is_put_or_get) pairs a script runs, from the bundle when replaying one
+        """
+        if self.bundle is not None:
+            for entry in self.bundle.statements(current_script, self._slot_values):
+                yield entry
+            return
+        with open(self.path + current_script + ".sql", "r", encoding='utf-8') as fin:
+            for entry in split_sql(RenderedStream(self.substitution.substitute_lines(fin))):
+                yield entry
+
+    def _validated_statements(self, current_script, is_prepared):
+        """
+        Yields the (statement, is_put_or_get) pairs validate checks, from the workspace copy when is_prepared is set,
+        otherwise from the render cache when there is one
+
+        In streaming mode nothing is written to the cache here, so the run still streams a script that wasn't cached
+        """
+        prepared_script = None
+        if is_prepared:
+            prepared_script = self._prepared_path(current_script)
+        elif self.bundle is None and self.render_cache is not None and self.is_streaming:
+            cache_key = self.render_cache.key(self.path + current_script + ".sql", self.substitution.pairs)
+            prepared_script = self.render_cache.get(cache_key)
+        elif self.bundle is None and self.render_cache is not None:
+            prepared_script = self._render_to_cache(current_script)
+        if prepared_script is None:
+            for entry in self._plan_statements(current_script):
+                yield entry
+            return
+        with open(prepared_script, "r", encoding='utf-8') as fin:
+            for entry in split_sql(fin):
+                yield entry
+
+    def _journal_plan(self, script_conn):
+        """
+        Returns the journal's id for a script's deployment: a hash of the substitution map and the account the
+        script's connection is for
+        """
+        target = [getattr(script_conn, name, None) for name in ("host", "account", "user")]
+        pairs = self.substitution.pairs if self.substitution is not None else []
+        return hashlib.sha256(json.dumps([pairs, target], default=str).encode("utf-8")).hexdigest()[:16]
+
+    def _execute_stream(self, current_script, script_conn, statements):
+        """
+        Runs each statement of a prepared script like execute_stream, journaling every result
+
+        When resuming, leading statements whose latest journal entry succeeded with the same text are skipped, so the
+        run picks up at the first statement that failed or never ran. Session statements among them are sent again,
+        and skipped CREATE DATABASE/SCHEMA statements are stood in for by the USE statements that set the same
+        context, so the statements that do run see the same role, database and variables. Stand-ins are not
+        journaled. In incremental mode, statements whose fingerprint is already in fingerprint_store are skipped unless
+        they touch objects a statement run before them changed (see accesses_conflict), with the same USE stand-ins
+        for skipped creates, and the store is updated with what the account now holds once the script ends. A failure
+        to update it is reported without hiding the script's own error; fingerprints that were not saved only make the
+        next run send more statements
+        """
+        journal_script = self.output_prefix + current_script
+        self._journal_plans[journal_script] = self._journal_plan(script_conn)
+        succeeded = {}
+        if self.is_resuming and self.journal is not None:
+            succeeded = self.journal.succeeded(journal_script, self._journal_plans[journal_script])
+
+        deployed = None
+        applied = []
+        skipped = 0
+        # statement_accesses of the statements run in incremental mode, and whether one of them can't be worked out
+        changed = []
+        changed_unknown = False
+        if self.is_incremental:
+            deployed = self.fingerprint_store.load(script_conn, journal_script)
+            context = hashlib.sha256()
+            occurrences = {}
+
+        def pending_statements():
+            nonlocal succeeded, skipped, changed_unknown
+            # USE statements standing in for skipped CREATE DATABASE/SCHEMA, sent before the next statement that runs
+            implied = []
+            for index, (statement, is_put_or_get) in enumerate(statements):
+                statement_hash = StatementJournal.statement_hash(statement)
+                use = _container_use(statement)
+
+                fingerprint = None
+                if deployed is not None:
+                    if SESSION_STATEMENT_REGEX.match(statement):
+                        # Session statements always run, and later fingerprints depend on them
+                        context.update(statement_hash.encode("utf-8"))
+                    else:
+                        # The same text can repeat in a script, so the occurrence is part of the fingerprint
+                        occurrences[statement_hash] = occurrences.get(statement_hash, 0) + 1
+                        fingerprint = hashlib.sha256((context.hexdigest() + statement_hash +
+                                                      str(occurrences[statement_hash])).encode("utf-8")).hexdigest()
+                        if use is not None:
+                            # A database or schema create also sets the context later statements run in
+                            context.update(statement_hash.encode("utf-8"))
+
+                if succeeded.get(index) == statement_hash:
+                    if SESSION_STATEMENT_REGEX.match(statement):
+                        # The new session has none of the context the interrupted run set up, so send it again
+                        for entry in self._flush_implied(index, implied):
+                            yield entry
+                        yield index, statement, statement_hash, is_put_or_get, None
+                        continue
+                    print("Resume: skipping statement " + str(index) + " of " + current_script)
+                    self._imply_use(implied, use)
+                    if fingerprint is not None:
+                        applied.append(fingerprint)
+                    continue
+                succeeded = {}
+
+                if fingerprint is not None:
+                    # Statements run again (a replaced database, say) can undo what later unchanged ones did
+                    accesses = statement_accesses(statement)
+                    if fingerprint in deployed and not changed_unknown and \
+                            not any(accesses_conflict(accesses, earlier) for earlier in changed):
+                        self._imply_use(implied, use)
+                        applied.append(fingerprint)
+                        skipped += 1
+                        continue
+                    if accesses is None:
+                        changed_unknown = True
+                    else:
+                        changed.append(accesses)
+
+                for entry in self._flush_implied(index, implied):
+                    yield entry
+                yield index, statement, statement_hash, is_put_or_get, fingerprint
+
+        try:
+            if self.batch_size > 1:
+                results = self._execute_batched(journal_script, script_conn, pending_statements())
+            elif self.max_in_flight > 1:
+                results = self._execute_async(journal_script, script_conn, pending_statements())
+            else:
+                results = ((pending, self._execute_statement(journal_script, script_conn, *pending[:4]))
+                           for pending in pending_statements())
+
+            for (index, _, statement_hash, _, fingerprint), cur in results:
+                if statement_hash is None:
+                    continue
+                if fingerprint is not None:
+                    applied.append(fingerprint)
+                yield index, cur
+        finally:
+            if deployed is not None:
+                print("Incremental: skipped " + str(skipped) + " unchanged statements of " + current_script)
+                try:
+                    self.fingerprint_store.save(script_conn, journal_script, applied)
+                except Exception as e:
+                    print("Incremental: could not save fingerprints for " + current_script + ": " + repr(e))
+
+    @staticmethod
+    def _imply_use(implied, use):
+        """
+        Adds the USE statement for a skipped CREATE DATABASE/SCHEMA to implied; a database resets the schema
+        """
+        if use is None:
+            return
+        if use.startswith("use database"):
+            implied[:] = [use]
+        else:
+            implied[:] = [statement for statement in implied if statement.startswith("use database")] + [use]
+
+    @staticmethod
+    def _flush_implied(index, implied):
+        """
+        Yields the pending stand-in USE statements as pending entries without a hash, which are never journaled
+        """
+        for use in implied:
+            yield index, use, None, False, None
+        implied[:] = []
+
+    def _execute_statement(self, journal_script, script_conn, index, statement, statement_hash, is_put_or_get):
+        """
+        Runs one statement on a new cursor, firing hooks and journaling the result
+        """
+        start = self._statement_started(journal_script, index, statement)
+        try:
+            cur = None
+            if self.session_pool is not None:
+                cur = self.session_pool.answer(script_conn, statement)
+            if cur is None:
+                cur = script_conn.cursor()
+                cur.execute(statement, _is_put_get=is_put_or_get)
+        except Exception as e:
+            self._statement_failed(journal_script, index, statement, statement_hash, start, e)
+            raise
+
+        if self.session_pool is not None:
+            self.session_pool.observe(script_conn, statement)
+        self._statement_succeeded(journal_script, index, statement, statement_hash, start, cur)
+        return cur
+
+    def _execute_batched(self, journal_script, script_conn, pending):
+        """
+        Sends consecutive statements as multi-statement requests of up to batch_size statements and batch_max_bytes
+        bytes, and yields (pending, cursor) for each statement in order
+
+        PUT/GET, which multi-statement requests don't accept, and probes session_pool can answer are sent on their own
+        between batches.
+        """
+        batch = []
+        size = 0
+        for entry in pending:
+            index, statement, statement_hash, is_put_or_get, _ = entry
+            alone = is_put_or_get or (self.session_pool is not None and PROBE_REGEX.match(statement))
+            statement_size = len(statement.encode("utf-8"))
+            if batch and (alone or len(batch) >= self.batch_size or size + statement_size > self.batch_max_bytes):
+                for result in self._execute_batch(journal_script, script_conn, batch):
+                    yield result
+                batch = []
+                size = 0
+
+            if alone:
+                yield entry, self._execute_statement(journal_script, script_conn, index, statement, statement_hash,
+                                                     is_put_or_get)
+            else:
+                batch.append(entry)
+                size += statement_size
+
+        if batch:
+            for result in self._execute_batch(journal_script, script_conn, batch):
+                yield result
+
+    def _execute_batch(self, journal_script, script_conn, batch):
+        """
+        Runs a list of pending statements in one request, yielding (pending, cursor) as the cursor moves through the
+        result of each statement
+
+        Statements before the one that failed in a request are still applied. They are found in the session's query
+        history (see _batch_applied) and journaled as succeeded, and the rest are journaled as failed so a resumed run
+        starts again at the statement that failed
+        """
+        if len(batch) == 1:
+            index, statement, statement_hash, is_put_or_get, _ = batch[0]
+            yield batch[0], self._execute_statement(journal_script, script_conn, index, statement, statement_hash,
+                                                    is_put_or_get)
+            return
+
+        starts = [self._statement_started(journal_script, entry[0], entry[1]) for entry in batch]
+        cur = script_conn.cursor()
+        position = 0
+        try:
+            cur.execute("\n".join(entry[1] for entry in batch), num_statements=len(batch))
+            for position, entry in enumerate(batch):
+                if position > 0 and cur.nextset() is None:
+                    raise ValueError("Multi-statement request returned fewer results than statements")
+                index, statement, statement_hash, _, _ = entry
+                if self.session_pool is not None:
+                    self.session_pool.observe(script_conn, statement)
+                self._statement_succeeded(journal_script, index, statement, statement_hash, starts[position], cur)
+                yield entry, cur
+        except Exception as e:
+            if position == 0:
+                applied = self._batch_applied(script_conn, getattr(e, "sfqid", None) or cur.sfqid, len(batch))
+                if applied is None:
+                    print("Could not tell which statements of the failed batch were applied; check statements " +
+                          str(batch[0][0]) + "-" + str(batch[-1][0]) + " of " + journal_script + " before resuming")
+                    applied = []
+                for entry, start, query_id in zip(batch, starts, applied):
+                    index, statement, statement_hash, _, _ = entry
+                    if self.session_pool is not None:
+                        self.session_pool.observe(script_conn, statement)
+                    if self.subscribers:
+                        self._emit("statement_end", script=journal_script, index=index, statement=statement,
+                                   start=start, duration=time.perf_counter() - start, query_id=query_id, rows=None)
+                    if self.journal is not None and statement_hash is not None:
+                        self.journal.record(journal_script, index, statement_hash, query_id, "succeeded",
+                                            plan=self._journal_plans.get(journal_script))
+                position = len(applied)
+            print("Failed batch of statements " + str(batch[position][0]) + "-" + str(batch[-1][0]) + " of " +
+                  journal_script + ": " + repr(e))
+            for entry, start in zip(batch[position:], starts[position:]):
+                self._statement_failed(journal_script, entry[0], entry[1], entry[2], start, e)
+            raise
+
+    @staticmethod
+    def _batch_applied(script_conn, parent_query_id, count):
+        """
+        Returns the query ids of the statements a failed multi-statement request ran successfully before one failed,
+        read from the session's query history, or None when they can't be found
+
+        The statements of a request run one after another as child queries that start after the request itself.
+        """
+        if parent_query_id is None:
+            return None
+        try:
+            cur = script_conn.cursor()
+            cur.execute("select query_id, query_type, execution_status, start_time from "
+                        "table(information_schema.query_history_by_session(result_limit => 10000)) "
+                        "order by start_time, query_id")
+            history = cur.fetchall()
+        except Exception as e:
+            print("Could not read query history: " + repr(e))
+            return None
+
+        children = None
+        for query_id, query_type, status, _ in history:
+            if query_id == parent_query_id:
+                children = []
+            elif children is not None and query_type != "MULTI_STATEMENT":
+                children.append((query_id, status))
+        if children is None:
+            return None
+
+        applied = []
+        for query_id, status in children:
+            if status != "SUCCESS":
+                break
+            applied.append(query_id)
+        if len(applied) >= count:
+            return None
+        return applied
+
+    def _execute_async(self, journal_script, script_conn, pending):
+        """
+        Submits statements asynchronously, keeping up to max_in_flight running at once, and yields (pending, cursor)
+        as each one finishes
+
+        A statement is only submitted once nothing still running touches the same objects (see statement_accesses).
+        Statements whose objects can't be worked out, PUT/GET and probes session_pool can answer wait for everything
+        before them and run alone.
+        """
+        in_flight = []
+        try:
+            for entry in pending:
+                index, statement, statement_hash, is_put_or_get, _ = entry
+                if is_put_or_get or (self.session_pool is not None and PROBE_REGEX.match(statement)):
+                    accesses = None
                 else:
-                    print("Debug mode: File generated but not run for " + current_script)
+                    accesses = statement_accesses(statement)
+                while in_flight and (len(in_flight) >= self.max_in_flight or
+                                     any(accesses_conflict(accesses, running[3]) for running in in_flight)):
+                    for result in self._wait_async(journal_script, script_conn, in_flight):
+                        yield result
+
+                if accesses is None:
+                    yield entry, self._execute_statement(journal_script, script_conn, index, statement,
+                                                         statement_hash, is_put_or_get)
+                    continue
+
+                start = self._statement_started(journal_script, index, statement)
+                cur = script_conn.cursor()
+                try:
+                    cur.execute_async(statement)
+                except Exception as e:
+                    self._statement_failed(journal_script, index, statement, statement_hash, start, e)
+                    raise
+                in_flight.append((entry, cur, start, accesses))
+
+            while in_flight:
+                for result in self._wait_async(journal_script, script_conn, in_flight):
+                    yield result
+        finally:
+            # Leave nothing running unobserved if the caller stops early or a submission fails
+            while in_flight:
+                try:
+                    for _ in self._wait_async(journal_script, script_conn, in_flight):
+                        pass
+                except Exception:
+                    pass
+
+    def _wait_async(self, journal_script, script_conn, in_flight):
+        """
+        Polls the running queries until at least one finishes, then yields the finished ones
+
+        If any of them failed, the others still running are waited for as well before the first error is raised.
+        Polling starts after 1 ms and backs off, but never sleeps longer than a quarter of the time the oldest query
+        has been running, so a finished query is noticed within a fraction of its own latency
+        """
+        delay = 0.001
+        while True:
+            finished = []
+            for running in list(in_flight):
+                if not script_conn.is_still_running(script_conn.get_query_status(running[1].sfqid)):
+                    in_flight.remove(running)
+                    finished.append(running)
+            if finished:
+                break
+            time.sleep(delay)
+            oldest_start = min(running[2] for running in in_flight)
+            delay = max(0.001, min(delay * 2, 0.5, (time.perf_counter() - oldest_start) / 4))
+
+        errors = []
+        for entry, cur, start, _ in finished:
+            index, statement, statement_hash, _, _ = entry
+            try:
+                script_conn.get_query_status_throw_if_error(cur.sfqid)
+                cur.get_results_from_sfqid(cur.sfqid)
+            except Exception as e:
+                self._statement_failed(journal_script, index, statement, statement_hash, start, e)
+                errors.append(e)
+                continue
+            self._statement_succeeded(journal_script, index, statement, statement_hash, start, cur)
+            yield entry, cur
+
+        if errors:
+            while in_flight:
+                try:
+                    for result in self._wait_async(journal_script, script_conn, in_flight):
+                        yield result
+                except Exception:
+                    pass
+            raise errors[0]
+
+    def _statement_started(self, journal_script, index, statement):
+        start = time.perf_counter()
+        if self.subscribers:
+            self._emit("statement_start", script=journal_script, index=index, statement=statement, start=start)
+        return start
+
+    def _statement_succeeded(self, journal_script, index, statement, statement_hash, start, cur):
+        if self.subscribers:
+            self._emit("statement_end", script=journal_script, index=index, statement=statement, start=start,
+                       duration=time.perf_counter() - start, query_id=cur.sfqid, rows=cur.rowcount)
+        if self.journal is not None and statement_hash is not None:
+            self.journal.record(journal_script, index, statement_hash, cur.sfqid, "succeeded",
+                                plan=self._journal_plans.get(journal_script))
+
+    def _statement_failed(self, journal_script, index, statement, statement_hash, start, error):
+        if self.journal is not None and statement_hash is not None:
+            self.journal.record(journal_script, index, statement_hash, getattr(error, "sfqid", None), "failed",
+                                str(error), self._journal_plans.get(journal_script))
+        if self.subscribers:
+            self._emit("statement_error", script=journal_script, index=index, statement=statement, start=start,
+                       duration=time.perf_counter() - start, error=error)
+
+    def _open_script(self, current_script):
+        """
+        Returns a readable prepared script
+
+        In streaming mode rendered text goes straight to the reader, and the prepared file is only written when
+        write_prepared is set. Otherwise, on a render_cache miss, the text is written once, into the cache directory,
+        and moved into place when the script has been read
+        """
+        if not self.is_streaming:
+            return open(self._prepare_script(current_script), "r", encoding='utf-8')
+
+        original_script = self.path + current_script + ".sql"
+        prepared_script = self._prepared_path(current_script)
+
+        cache_key = None
+        if self.render_cache is not None:
+            cache_key = self.render_cache.key(original_script, self.substitution.pairs)
+            cached_script = self.render_cache.get(cache_key)
+            if cached_script is not None:
+                self._emit("render", script=self.output_prefix + current_script, start=time.perf_counter(),
+                           duration=0.0, cached=True)
+                if self.write_prepared:
+                    shutil.copyfile(cached_script, self._temp_path(prepared_script))
+                    os.replace(self._temp_path(prepared_script), prepared_script)
+                return open(cached_script, "r", encoding='utf-8')
+
+        if not self.write_prepared:
+            if cache_key is None:
+                return RenderedStream(self._render_blocks(current_script))
+            temp_script = self.render_cache.temp_path(cache_key)
+            return RenderedStream(self._render_blocks(current_script), open(temp_script, "w", encoding='utf-8'),
+                                  lambda: self.render_cache.put(cache_key, temp_script, move=True))
+
+        # The prepared file only appears once the whole script has been read
+        def on_complete():
+            os.replace(self._temp_path(prepared_script), prepared_script)
+            if cache_key is not None:
+                self.render_cache.put(cache_key, prepared_script)
+        return RenderedStream(self._render_blocks(current_script),
+                              open(self._temp_path(prepared_script), "w", encoding='utf-8'), on_complete)
+
+    def _render_to_cache(self, current_script):
+        """
+        Returns the path of a script's prepared copy in render_cache, rendering it into the cache on a miss
+        """
+        cache_key = self.render_cache.key(self.path + current_script + ".sql", self.substitution.pairs)
+        cached_script = self.render_cache.get(cache_key)
+        if cached_script is not None:
+            return cached_script
+
+        temp_script = self.render_cache.temp_path(cache_key)
+        with open(temp_script, "w", encoding='utf-8') as fout:
+            for block in self._render_blocks(current_script):
+                fout.write(block)
+        return self.render_cache.put(cache_key, temp_script, move=True)
+
+    def _prepare_script(self, current_script):
+        """
+        Writes the prepared copy of a script to the run workspace and returns its path
+
+        The copy is written to a temporary file and renamed into place, so readers never see a partial script
+        """
+        original_script = self.path + current_script + ".sql"
+        prepared_script = self._prepared_path(current_script)
+        temp_script = self._temp_path(prepared_script)
+
+        cache_key = None
+        if self.render_cache is not None and self.bundle is None:
+            cache_key = self.render_cache.key(original_script, self.substitution.pairs)
+            cached_script = self.render_cache.get(cache_key)
+            if cached_script is not None:
+                self._emit("render", script=self.output_prefix + current_script, start=time.perf_counter(),
+                           duration=0.0, cached=True)
+                shutil.copyfile(cached_script, temp_script)
+                os.replace(temp_script, prepared_script)
+                return prepared_script
+
+        with open(temp_script, "w", encoding='utf-8') as fout:
+            for block in self._render_blocks(current_script):
+                fout.write(block)
+        os.replace(temp_script, prepared_script)
+
+        if cache_key is not None:
+            self.render_cache.put(cache_key, prepared_script)
+        return prepared_script
+
+    def _render_blocks(self, current_script):
+        """
+        Reads a template and yields it with replacements applied
+
+        Comments are left in place; split_sql drops them when the script runs. When replaying a bundle, its
+        statements are yielded one per line instead
+        """
+        if self.bundle is not None:
+            for statement, _ in self.bundle.statements(current_script, self._slot_values):
+                yield statement + "\n"
+            return
+
+        original_script = self.path + current_script + ".sql"
+        start = time.perf_counter()
+        duration = 0.0
+        with open(original_script, "r", encoding='utf-8') as fin:
+            blocks = self.substitution.substitute_lines(fin)
+            while True:
+                # Only time spent rendering counts, not time the reader spends between blocks
+                block_start = time.perf_counter()
+                block = next(blocks, None)
+                duration += time.perf_counter() - block_start
+                if block is None:
+                    break
+                yield block
+
+        self._emit("render", script=self.output_prefix + current_script, start=start, duration=duration, cached=False)
 
     def prepare_deployment(self, is_debug_mode, dcr_version, provider_account, provider_conn, consumer_account,
                            consumer_conn, abbreviation, path):
@@ -72,6 +2211,8 @@ class SnowflakeDcr:
         Prepares object to deploy 2-party DCRs
         """
         # prepare accounts
+        provider_conn = self._session(provider_account, provider_conn)
+        consumer_conn = self._session(consumer_account, consumer_conn)
         provider_account = provider_account.split(".")[0].upper()
         consumer_account = consumer_account.split(".")[0].upper()
 
@@ -87,18 +2228,16 @@ class SnowflakeDcr:
                                 consumer_conn,
                                 provider_conn, provider_conn,
                                 consumer_conn]
+            # The ML scripts only need the consumer enabled, so they can run side by side
+            script_dependencies = {"consumer_ml": ["provider_enable_consumer"]}
 
             check_words = ["SNOWCAT2", "snowcat2", "SNOWCAT", "snowcat", "_DEMO_", "_demo_"]
             replace_words = [provider_account, provider_account, consumer_account, consumer_account,
                              "_" + abbreviation +
                              "_", "_" + abbreviation + "_"]
 
-            self.is_debug_mode = is_debug_mode
-            self.path = path
-            self.script_list = script_list
-            self.script_conn_list = script_conn_list
-            self.check_words = check_words
-            self.replace_words = replace_words
+            self._set_plan(is_debug_mode, path, script_list, script_conn_list, check_words, replace_words,
+                           script_dependencies)
         elif dcr_version == "5.5 Jinja":
             if abbreviation == "":
                 abbreviation = "samp"
@@ -121,12 +2260,7 @@ class SnowflakeDcr:
                              "_" + abbreviation +
                              "_", "_" + abbreviation + "_", ""]
 
-            self.is_debug_mode = is_debug_mode
-            self.path = path
-            self.script_list = script_list
-            self.script_conn_list = script_conn_list
-            self.check_words = check_words
-            self.replace_words = replace_words
+            self._set_plan(is_debug_mode, path, script_list, script_conn_list, check_words, replace_words)
         elif dcr_version == "5.5 SQL Param":
             if abbreviation == "":
                 abbreviation = "samp"
@@ -143,12 +2277,7 @@ class SnowflakeDcr:
                              "_" + abbreviation +
                              "_", "_" + abbreviation + "_"]
 
-            self.is_debug_mode = is_debug_mode
-            self.path = path
-            self.script_list = script_list
-            self.script_conn_list = script_conn_list
-            self.check_words = check_words
-            self.replace_words = replace_words
+            self._set_plan(is_debug_mode, path, script_list, script_conn_list, check_words, replace_words)
         elif dcr_version == "ID Resolution Native App":
             # TODO - Automate ID Resolution
             var = None
@@ -159,6 +2288,8 @@ class SnowflakeDcr:
         Prepares object to add consumers to existing DCRs
         """
         # prepare accounts
+        provider_conn = self._session(provider_account, provider_conn)
+        consumer_conn = self._session(consumer_account, consumer_conn)
         provider_account = provider_account.split(".")[0].upper()
         consumer_account = consumer_account.split(".")[0].upper()
 
@@ -174,17 +2305,14 @@ class SnowflakeDcr:
                                 consumer_conn,
                                 provider_conn, provider_conn,
                                 consumer_conn]
+            script_dependencies = {"consumer_ml": ["provider_enable_consumer"]}
 
             check_words = ["SNOWCAT4", "snowcat4", "SNOWCAT2", "snowcat2", "SNOWCAT", "snowcat", "_DEMO_", "_demo_"]
             replace_words = [consumer_account, consumer_account, provider_account, provider_account, consumer_account,
                              consumer_account, "_" + abbreviation + "_", "_" + abbreviation + "_"]
 
-            self.is_debug_mode = is_debug_mode
-            self.path = path
-            self.script_list = script_list
-            self.script_conn_list = script_conn_list
-            self.check_words = check_words
-            self.replace_words = replace_words
+            self._set_plan(is_debug_mode, path, script_list, script_conn_list, check_words, replace_words,
+                           script_dependencies)
         elif dcr_version == "5.5 Jinja":
             if abbreviation == "":
                 abbreviation = "samp"
@@ -207,12 +2335,7 @@ class SnowflakeDcr:
                              "_" + abbreviation +
                              "_", "_" + abbreviation + "_", ""]
 
-            self.is_debug_mode = is_debug_mode
-            self.path = path
-            self.script_list = script_list
-            self.script_conn_list = script_conn_list
-            self.check_words = check_words
-            self.replace_words = replace_words
+            self._set_plan(is_debug_mode, path, script_list, script_conn_list, check_words, replace_words)
         elif dcr_version == "5.5 SQL Param":
             if abbreviation == "":
                 abbreviation = "samp"
@@ -229,12 +2352,48 @@ class SnowflakeDcr:
                              "_" + abbreviation +
                              "_", "_" + abbreviation + "_"]
 
-            self.is_debug_mode = is_debug_mode
-            self.path = path
-            self.script_list = script_list
-            self.script_conn_list = script_conn_list
-            self.check_words = check_words
-            self.replace_words = replace_words
+            self._set_plan(is_debug_mode, path, script_list, script_conn_list, check_words, replace_words)
+
+    def prepare_consumer_fleet(self, is_debug_mode, dcr_version, provider_account, provider_conn, consumers,
+                               abbreviation, path):
+        """
+        Prepares object to add several consumers to an existing DCR with execute_fleet
+
+        consumers is a list of (consumer_account, consumer_conn) pairs. Provider scripts that render to the same text
+        for every consumer are shared and run once for the whole fleet.
+        """
+        provider_conn = self._session(provider_account, provider_conn)
+        fleet = []
+        for consumer_account, consumer_conn in consumers:
+            member = SnowflakeDcr()
+            self._copy_settings(member)
+            member.prepare_consumer_addition(is_debug_mode, dcr_version, provider_account, provider_conn,
+                                             consumer_account, consumer_conn, abbreviation, path)
+            member.output_prefix = consumer_account.split(".")[0].upper() + "-"
+            fleet.append((consumer_account.split(".")[0].upper(), member))
+
+        if not fleet or fleet[0][1].script_list is None:
+            print("No consumers to prepare!")
+            return
+
+        first = fleet[0][1]
+        shared_scripts = []
+        for current_script, script_conn in zip(first.script_list, first.script_conn_list):
+            if script_conn is not provider_conn:
+                continue
+            try:
+                with open(path + current_script + ".sql", "r", encoding='utf-8') as fin:
+                    template = fin.read()
+            except OSError:
+                continue
+            if len(set(member.substitution.substitute(template) for _, member in fleet)) == 1:
+                shared_scripts.append(current_script)
+
+        self.is_debug_mode = is_debug_mode
+        self.path = path
+        self.provider_conn = provider_conn
+        self.fleet = fleet
+        self.fleet_shared_scripts = shared_scripts
 
     def prepare_provider_addition(self, is_debug_mode, dcr_version, provider_account, provider_conn, consumer_account,
                                   consumer_conn, abbreviation, app_suffix, path):
@@ -242,6 +2401,8 @@ class SnowflakeDcr:
         Prepares object to add providers to existing DCRs
         """
         # prepare accounts
+        provider_conn = self._session(provider_account, provider_conn)
+        consumer_conn = self._session(consumer_account, consumer_conn)
         provider_account = provider_account.split(".")[0].upper()
         consumer_account = consumer_account.split(".")[0].upper()
 
@@ -259,6 +2420,7 @@ class SnowflakeDcr:
                                 consumer_conn,
                                 provider_conn, provider_conn,
                                 consumer_conn]
+            script_dependencies = {"consumer_ml": ["provider_enable_consumer"]}
 
             check_words = ["dcr_demo_app_two", "DCR_DEMO_APP_TWO", "SNOWCAT3", "snowcat3", "SNOWCAT2", "snowcat2",
                            "SNOWCAT", "snowcat", "_DEMO_", "_demo_"]
@@ -268,12 +2430,8 @@ class SnowflakeDcr:
                              "_" + abbreviation +
                              "_", "_" + abbreviation + "_"]
 
-            self.is_debug_mode = is_debug_mode
-            self.path = path
-            self.script_list = script_list
-            self.script_conn_list = script_conn_list
-            self.check_words = check_words
-            self.replace_words = replace_words
+            self._set_plan(is_debug_mode, path, script_list, script_conn_list, check_words, replace_words,
+                           script_dependencies)
         elif dcr_version == "5.5 Jinja":
             if abbreviation == "":
                 abbreviation = "samp"
@@ -300,12 +2458,7 @@ class SnowflakeDcr:
                              provider_account, provider_account, provider_account, provider_account, consumer_account,
                              consumer_account, "_" + abbreviation + "_", "_" + abbreviation + "_", ""]
 
-            self.is_debug_mode = is_debug_mode
-            self.path = path
-            self.script_list = script_list
-            self.script_conn_list = script_conn_list
-            self.check_words = check_words
-            self.replace_words = replace_words
+            self._set_plan(is_debug_mode, path, script_list, script_conn_list, check_words, replace_words)
         elif dcr_version == "5.5 SQL Param":
             if abbreviation == "":
                 abbreviation = "samp"
@@ -327,12 +2480,7 @@ class SnowflakeDcr:
                              "_" + abbreviation +
                              "_", "_" + abbreviation + "_"]
 
-            self.is_debug_mode = is_debug_mode
-            self.path = path
-            self.script_list = script_list
-            self.script_conn_list = script_conn_list
-            self.check_words = check_words
-            self.replace_words = replace_words
+            self._set_plan(is_debug_mode, path, script_list, script_conn_list, check_words, replace_words)
 
     def prepare_upgrade(self, is_debug_mode, provider_account, provider_conn, consumer_account, consumer_conn,
                         new_abbreviation, old_abbreviation, path):
@@ -340,6 +2488,8 @@ class SnowflakeDcr:
         Prepares object to upgrade DCRs from v5.5 to v6.0
         """
         # prepare accounts
+        provider_conn = self._session(provider_account, provider_conn)
+        consumer_conn = self._session(consumer_account, consumer_conn)
         provider_account = provider_account.split(".")[0].upper()
         consumer_account = consumer_account.split(".")[0].upper()
 
@@ -357,18 +2507,15 @@ class SnowflakeDcr:
                             consumer_conn,
                             provider_conn, provider_conn,
                             consumer_conn]
+        script_dependencies = {"consumer_ml": ["provider_enable_consumer"]}
 
         check_words = ["SNOWCAT2", "snowcat2", "SNOWCAT", "snowcat", "_DEMO_", "_demo_", "_SAMP_", "_samp_"]
         replace_words = [provider_account, provider_account, consumer_account, consumer_account,
                          "_" + new_abbreviation + "_",
                          "_" + new_abbreviation + "_", "_" + old_abbreviation + "_", "_" + old_abbreviation + "_"]
 
-        self.is_debug_mode = is_debug_mode
-        self.path = path
-        self.script_list = script_list
-        self.script_conn_list = script_conn_list
-        self.check_words = check_words
-        self.replace_words = replace_words
+        self._set_plan(is_debug_mode, path, script_list, script_conn_list, check_words, replace_words,
+                       script_dependencies)
 
     # Uninstalls DCRs for an account (provider or consumer)
     def prepare_uninstall(self, is_debug_mode, dcr_version, account_type, account, account_conn, consumer_account,
@@ -377,6 +2524,7 @@ class SnowflakeDcr:
         Prepares object to uninstall DCRs for an account (provider or consumer)
         """
         # prepare accounts
+        account_conn = self._session(account, account_conn)
         account = account.split(".")[0].upper()
         consumer_account = consumer_account.split(".")[0].upper()
 
@@ -404,12 +2552,7 @@ class SnowflakeDcr:
                 script_list = []
                 script_conn_list = []
 
-            self.is_debug_mode = is_debug_mode
-            self.path = path
-            self.script_list = script_list
-            self.script_conn_list = script_conn_list
-            self.check_words = check_words
-            self.replace_words = replace_words
+            self._set_plan(is_debug_mode, path, script_list, script_conn_list, check_words, replace_words)
         elif dcr_version == "5.5 Jinja" or dcr_version == "5.5 SQL Param":
             if abbreviation == "":
                 abbreviation = "samp"
@@ -428,9 +2571,4 @@ class SnowflakeDcr:
             replace_words = [account, account, consumer_account, consumer_account, "_" + abbreviation + "_",
                              "_" + abbreviation + "_"]
 
-            self.is_debug_mode = is_debug_mode
-            self.path = path
-            self.script_list = script_list
-            self.script_conn_list = script_conn_list
-            self.check_words = check_words
-            self.replace_words = replace_words
+            self._set_plan(is_debug_mode, path, script_list, script_conn_list, check_words, replace_words)
@@ -0,0 +1,54 @@
+"""
+Shared fixtures: a SnowflakeDcr planned against FakeConnection, with every file it writes under tmp_path
+"""
+import json
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "benchmarks"))
+
+from snowflake_dcr import SnowflakeDcr, StatementJournal  # noqa: E402
+
+
+@pytest.fixture
+def make_dcr(tmp_path, monkeypatch):
+    """
+    Returns a function that plans scripts ({name: sql}) on connections ({name: conn}) and applies settings
+    """
+    monkeypatch.chdir(tmp_path)
+
+    def make(scripts, conns, check_words=(), replace_words=(), is_debug_mode=False, script_dependencies=None,
+             **settings):
+        templates = tmp_path / "templates"
+        templates.mkdir(exist_ok=True)
+        for name, sql in scripts.items():
+            (templates / (name + ".sql")).write_text(sql, encoding="utf-8")
+        dcr = SnowflakeDcr()
+        dcr.output_directory = str(tmp_path / "output")
+        dcr.render_cache = None
+        dcr.result_sink = None
+        dcr.is_validating = False
+        dcr.journal = StatementJournal(str(tmp_path / "journal.jsonl"))
+        for name, value in settings.items():
+            setattr(dcr, name, value)
+        dcr._set_plan(is_debug_mode, str(templates) + "/", list(scripts), [conns[name] for name in scripts],
+                      list(check_words), list(replace_words), script_dependencies)
+        return dcr
+
+    return make
+
+
+@pytest.fixture
+def journal_statuses(tmp_path):
+    """
+    Returns a function listing (script, index, status) for every journal entry in order
+    """
+    def statuses():
+        with open(tmp_path / "journal.jsonl", "r", encoding="utf-8") as fin:
+            return [(entry["script"], entry["index"], entry["status"]) for entry in map(json.loads, fin)]
+
+    return statuses
@@ -0,0 +1,59 @@
+"""
+Tests for submitting statements asynchronously with max_in_flight
+"""
+import time
+
+import pytest
+
+from fake_snowflake import FakeConnection
+from snowflake_dcr import accesses_conflict, statement_accesses
+
+INDEPENDENT = "".join("create table db.s.t" + str(index) + " (x int);\n" for index in range(4))
+DEPENDENT = "".join("update db.s.t set x = " + str(index) + ";\n" for index in range(8))
+
+
+def run(make_dcr, sql, **settings):
+    conn = FakeConnection(latency=0.02)
+    dcr = make_dcr({"script": sql}, {"script": conn}, **settings)
+    start = time.perf_counter()
+    dcr.execute_locally()
+    return conn, time.perf_counter() - start
+
+
+def test_independent_statements_overlap(make_dcr, journal_statuses):
+    conn, duration = run(make_dcr, INDEPENDENT, max_in_flight=4)
+    assert conn.statements == INDEPENDENT.splitlines()
+    assert duration < 3 * 0.02
+    assert journal_statuses() == [("script", index, "succeeded") for index in range(4)]
+
+
+def test_conflicting_statements_are_not_slower_than_sequential(make_dcr):
+    _, sequential = run(make_dcr, DEPENDENT)
+    conn, duration = run(make_dcr, DEPENDENT, max_in_flight=4)
+    assert conn.statements == DEPENDENT.splitlines()
+    assert duration < sequential * 1.3
+
+
+def test_failure_is_raised_after_running_statements_finish(make_dcr, journal_statuses):
+    conn = FakeConnection(latency=0.02, fail_on=lambda statement: "t1 " in statement)
+    dcr = make_dcr({"script": INDEPENDENT}, {"script": conn}, max_in_flight=4)
+    with pytest.raises(Exception, match="Simulated async failure"):
+        dcr.execute_locally()
+    assert sorted(journal_statuses()) == [("script", 0, "succeeded"), ("script", 1, "failed"),
+                                          ("script", 2, "succeeded"), ("script", 3, "succeeded")]
+
+
+@pytest.mark.parametrize("first, second", [
+    ("create or replace database dcr_db;", "create schema cleanroom;"),
+    ("create or replace schema db.cleanroom;", "create table t1 (x int);"),
+    ("create transient schema if not exists s;", "select * from other.s.t;"),
+])
+def test_create_database_and_schema_are_barriers(first, second):
+    assert statement_accesses(first) is None
+    assert accesses_conflict(statement_accesses(first), statement_accesses(second))
+
+
+def test_independent_statements_do_not_conflict():
+    assert statement_accesses("create database role db.r1;") is not None
+    assert not accesses_conflict(statement_accesses("create table db.s.t1 (x int);"),
+                                 statement_accesses("create table db.s.t2 (x int);"))
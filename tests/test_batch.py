@@ -0,0 +1,35 @@
+"""
+Tests for sending statements as multi-statement requests with batch_size
+"""
+import pytest
+
+from fake_snowflake import FakeConnection
+
+SQL = "".join("insert into t values (" + str(index) + ");\n" for index in range(4))
+
+
+def test_statements_are_sent_in_batches(make_dcr, journal_statuses):
+    conn = FakeConnection()
+    make_dcr({"script": SQL}, {"script": conn}, batch_size=3).execute_locally()
+    assert conn.statements == SQL.splitlines()
+    assert conn.round_trips == 2
+    assert journal_statuses() == [("script", index, "succeeded") for index in range(4)]
+
+
+def test_batch_max_bytes_splits_batches(make_dcr):
+    conn = FakeConnection()
+    make_dcr({"script": SQL}, {"script": conn}, batch_size=4, batch_max_bytes=60).execute_locally()
+    assert conn.statements == SQL.splitlines()
+    assert conn.round_trips == 2
+
+
+def test_failed_batch_journals_applied_statements(make_dcr, journal_statuses):
+    failing = FakeConnection(fail_on=lambda statement: "(2)" in statement)
+    with pytest.raises(Exception):
+        make_dcr({"script": SQL}, {"script": failing}, batch_size=4).execute_locally()
+    assert journal_statuses() == [("script", 0, "succeeded"), ("script", 1, "succeeded"), ("script", 2, "failed"),
+                                  ("script", 3, "failed")]
+
+    conn = FakeConnection()
+    make_dcr({"script": SQL}, {"script": conn}, batch_size=4, is_resuming=True).execute_locally()
+    assert conn.statements == ["insert into t values (2);", "insert into t values (3);"]
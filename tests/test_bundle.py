@@ -0,0 +1,69 @@
+"""
+Tests for compiling prepared plans into bundles and replaying them
+"""
+import pytest
+
+from fake_snowflake import FakeConnection
+from snowflake_dcr import DcrBundle
+
+SCRIPTS = {
+    "provider_init": "create database dcr_SNOWCAT2_db;\n-- shared with SNOWCAT\ngrant usage on database "
+                     "dcr_SNOWCAT2_db to share s_snowcat;\ninsert into t values ('snowcat2', 'a;b');\n",
+    "consumer_init": "create database dcr_SNOWCAT_db from share SNOWCAT2.s_snowcat;\n"
+                     "select 'SNOWCAT', 'SNOWCAT2CAT';\n",
+}
+CHECK_WORDS = ["SNOWCAT2", "snowcat2", "SNOWCAT", "snowcat"]
+
+
+def plan(make_dcr, provider_account, consumer_account, check_words=CHECK_WORDS):
+    conns = {"provider_init": FakeConnection(name="provider"), "consumer_init": FakeConnection(name="consumer")}
+    replace_words = [provider_account, provider_account, consumer_account, consumer_account][:len(check_words)]
+    return make_dcr(SCRIPTS, conns, check_words, replace_words), conns
+
+
+def test_replay_sends_the_statements_rendering_would(make_dcr, tmp_path):
+    compiled, _ = plan(make_dcr, "PROV1", "CONS1")
+    compiled.compile_bundle(str(tmp_path / "plan.dcrb")).close()
+
+    rendered, rendered_conns = plan(make_dcr, "PROV2", "CONS2")
+    rendered.execute_locally()
+    replayed, replayed_conns = plan(make_dcr, "PROV2", "CONS2")
+    replayed.replay_bundle(str(tmp_path / "plan.dcrb"))
+    replayed.execute_locally()
+
+    for name in SCRIPTS:
+        assert replayed_conns[name].statements == rendered_conns[name].statements
+    assert replayed_conns["consumer_init"].statements[0] == "create database dcr_CONS2_db from share PROV2.s_CONS2;"
+    replayed.bundle.close()
+
+
+def test_tampered_bundles_are_rejected(make_dcr, tmp_path):
+    compiled, _ = plan(make_dcr, "PROV1", "CONS1")
+    compiled.compile_bundle(str(tmp_path / "plan.dcrb")).close()
+    data = bytearray((tmp_path / "plan.dcrb").read_bytes())
+    data[-1] ^= 1
+    (tmp_path / "plan.dcrb").write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="don't match their hash"):
+        DcrBundle.load(str(tmp_path / "plan.dcrb"))
+
+
+@pytest.mark.parametrize("provider_account, message", [
+    ("PROV'1", "can't be filled into a bundle"),
+    ("SNOW", "differently from the templates"),
+])
+def test_unsafe_replacements_are_rejected(make_dcr, tmp_path, provider_account, message):
+    compiled, _ = plan(make_dcr, "PROV1", "CONS1")
+    compiled.compile_bundle(str(tmp_path / "plan.dcrb")).close()
+    replayed, _ = plan(make_dcr, provider_account, "CONS2")
+    bundle = DcrBundle.load(str(tmp_path / "plan.dcrb"))
+    with pytest.raises(ValueError, match=message):
+        replayed.replay_bundle(bundle)
+    bundle.close()
+
+
+def test_plans_with_other_check_words_are_rejected(make_dcr, tmp_path):
+    compiled, _ = plan(make_dcr, "PROV1", "CONS1")
+    compiled.compile_bundle(str(tmp_path / "plan.dcrb")).close()
+    replayed, _ = plan(make_dcr, "PROV2", "CONS2", check_words=CHECK_WORDS[:2])
+    with pytest.raises(ValueError, match="compiled for check words"):
+        replayed.replay_bundle(str(tmp_path / "plan.dcrb"))
@@ -0,0 +1,73 @@
+"""
+Tests for prepare_consumer_fleet and execute_fleet
+"""
+import pytest
+
+from fake_snowflake import FakeConnection
+from snowflake_dcr import SnowflakeDcr, StatementJournal
+
+TEMPLATES = {
+    "provider_init_new_consumer": "select 'init SNOWCAT4';\n",
+    "consumer_init": "select 'consumer SNOWCAT4';\n",
+    "provider_enable_consumer": "select 'enable SNOWCAT4';\n",
+    "provider_ml": "select 'ml SNOWCAT2';\n",
+    "consumer_ml": "select 'consumer ml SNOWCAT4';\n",
+}
+
+
+@pytest.fixture
+def fleet(tmp_path, monkeypatch):
+    """
+    Returns a function that prepares a 6.0 fleet of consumers ({account: conn}) on a provider connection
+    """
+    monkeypatch.chdir(tmp_path)
+    for name, sql in TEMPLATES.items():
+        (tmp_path / (name + ".sql")).write_text(sql, encoding="utf-8")
+
+    def prepare(provider_conn, consumers, **settings):
+        dcr = SnowflakeDcr()
+        dcr.output_directory = str(tmp_path / "output")
+        dcr.render_cache = None
+        dcr.result_sink = None
+        dcr.journal = StatementJournal(str(tmp_path / "journal.jsonl"))
+        for name, value in settings.items():
+            setattr(dcr, name, value)
+        dcr.prepare_consumer_fleet(False, "6.0 Native App", "PROV", provider_conn, list(consumers.items()), "",
+                                   str(tmp_path) + "/")
+        return dcr
+
+    return prepare
+
+
+def test_shared_scripts_run_once(fleet):
+    provider = FakeConnection(name="provider")
+    dcr = fleet(provider, {"C1": FakeConnection(name="c1"), "C2": FakeConnection(name="c2")})
+    assert dcr.fleet_shared_scripts == ["provider_ml"]
+
+    summary = dcr.execute_fleet()
+    assert provider.statements.count("select 'ml PROV';") == 1
+    assert sorted(statement for statement in provider.statements if "enable" in statement) == \
+        ["select 'enable C1';", "select 'enable C2';"]
+    for account in ("C1", "C2"):
+        assert summary[account]["status"] == "succeeded"
+        assert summary[account]["scripts"] == list(TEMPLATES)
+
+
+def test_failed_consumer_is_not_credited_with_later_shared_scripts(fleet):
+    provider = FakeConnection(name="provider")
+    failing = FakeConnection(name="c2", fail_on=lambda statement: "consumer" in statement)
+    dcr = fleet(provider, {"C1": FakeConnection(name="c1"), "C2": failing})
+
+    summary = dcr.execute_fleet()
+    assert summary["C1"]["scripts"] == list(TEMPLATES)
+    assert summary["C2"]["status"] == "failed"
+    assert summary["C2"]["scripts"] == ["provider_init_new_consumer"]
+    assert "select 'enable C2';" not in provider.statements
+
+
+def test_members_take_execution_settings(fleet):
+    dcr = fleet(FakeConnection(), {"C1": FakeConnection()}, batch_size=5, is_streaming=True, journal=None)
+    dcr.max_in_flight = 3
+    dcr.execute_fleet()
+    member = dcr.fleet[0][1]
+    assert (member.batch_size, member.is_streaming, member.journal, member.max_in_flight) == (5, True, None, 3)
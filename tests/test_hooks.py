@@ -0,0 +1,67 @@
+"""
+Tests for run hooks and TraceCollector
+"""
+import json
+
+import pytest
+
+from fake_snowflake import FakeConnection
+from snowflake_dcr import TraceCollector
+
+SQL = "select 1;\nselect 2;\n"
+
+
+def test_events_fire_in_order(make_dcr):
+    dcr = make_dcr({"script": SQL}, {"script": FakeConnection()})
+    events = []
+    for event in ("run_start", "run_end", "script_start", "script_end", "statement_start", "statement_end"):
+        dcr.subscribe(event, lambda event=event, **details: events.append((event, details.get("index"))))
+    dcr.execute_locally()
+    assert events == [("run_start", None), ("script_start", None), ("statement_start", 0), ("statement_end", 0),
+                      ("statement_start", 1), ("statement_end", 1), ("script_end", None), ("run_end", None)]
+
+
+def test_errors_fire_error_events(make_dcr):
+    dcr = make_dcr({"script": SQL}, {"script": FakeConnection(fail_on=lambda statement: "2" in statement)})
+    errors = []
+    for event in ("run_error", "script_error", "statement_error"):
+        dcr.subscribe(event, lambda event=event, error=None, **details: errors.append((event, str(error))))
+    with pytest.raises(Exception, match="Simulated failure"):
+        dcr.execute_locally()
+    assert [event for event, _ in errors] == ["statement_error", "script_error", "run_error"]
+    assert all("Simulated failure for: select 2;" in error for _, error in errors)
+
+
+def test_unknown_events_are_rejected(make_dcr):
+    dcr = make_dcr({"script": SQL}, {"script": FakeConnection()})
+    with pytest.raises(ValueError, match="Unknown event"):
+        dcr.subscribe("statement_done", print)
+
+
+def test_unsubscribed_callbacks_are_not_called(make_dcr):
+    dcr = make_dcr({"script": SQL}, {"script": FakeConnection()})
+    calls = []
+    callback = lambda **details: calls.append(details)  # noqa: E731
+    dcr.subscribe("run_start", callback)
+    dcr.unsubscribe("run_start", callback)
+    dcr.execute_locally()
+    assert calls == []
+
+
+def test_trace_collector_records_spans(make_dcr, tmp_path):
+    dcr = make_dcr({"script": SQL}, {"script": FakeConnection(rows=3)})
+    collector = TraceCollector()
+    collector.attach(dcr)
+    dcr.execute_locally()
+
+    assert sorted(event["cat"] for event in collector.events) == ["render", "run", "script", "statement",
+                                                                  "statement"]
+    assert [statement["rows"] for statement in collector.statements] == [3, 3]
+    assert all(statement["query_id"] for statement in collector.statements)
+    assert len(collector.slowest(1)) == 1
+
+    collector.write_chrome_trace(str(tmp_path / "trace.json"))
+    with open(tmp_path / "trace.json", encoding="utf-8") as fin:
+        trace = json.load(fin)
+    assert len(trace["traceEvents"]) == 5
+    assert all(event["ph"] == "X" for event in trace["traceEvents"])
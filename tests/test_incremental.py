@@ -0,0 +1,93 @@
+"""
+Tests for incremental mode and the fingerprint stores
+"""
+import pytest
+
+from fake_snowflake import FakeConnection
+from snowflake_dcr import LocalFingerprintStore, SnowflakeFingerprintStore
+
+
+@pytest.fixture
+def deploy(make_dcr, tmp_path):
+    """
+    Returns a function that runs sql incrementally on a new connection and returns the statements it sent
+    """
+    def run(sql, fingerprint_store=None, **settings):
+        conn = FakeConnection(**settings)
+        store = fingerprint_store or LocalFingerprintStore(str(tmp_path / "fingerprints.json"))
+        make_dcr({"script": sql}, {"script": conn}, is_incremental=True, fingerprint_store=store).execute_locally()
+        return conn.statements
+
+    return run
+
+
+SQL = ("use role r;\ncreate or replace database db1;\ncreate schema s1;\ncreate table t1 (x int);\n"
+       "create table other.s.u (x int);\n")
+
+
+def test_unchanged_statements_are_skipped(deploy):
+    assert deploy(SQL) == SQL.strip().split("\n")
+    assert deploy(SQL) == ["use role r;"]
+
+
+def test_edited_statement_runs_in_the_context_of_skipped_creates(deploy):
+    deploy(SQL)
+    assert deploy(SQL.replace("t1 (x int)", "t1 (x int, y int)")) == \
+        ["use role r;", "use database db1;", "use schema s1;", "create table t1 (x int, y int);"]
+
+
+def test_statements_after_a_rerun_create_run_again(deploy):
+    deploy(SQL)
+    assert deploy(SQL.replace("database db1;", "database db1 comment = 'x';")) == \
+        SQL.replace("database db1;", "database db1 comment = 'x';").strip().split("\n")
+
+
+def test_dependents_of_a_changed_statement_run_again(deploy):
+    sql = ("create or replace table db.s.t (x int);\ncreate view db.s.v as select * from db.s.t;\n"
+           "create table other.s.u (x int);\n")
+    deploy(sql)
+    assert deploy(sql.replace("(x int);\ncreate view", "(x int, y int);\ncreate view")) == \
+        ["create or replace table db.s.t (x int, y int);", "create view db.s.v as select * from db.s.t;"]
+
+
+def test_session_context_is_part_of_the_fingerprint(deploy):
+    deploy(SQL)
+    assert len(deploy(SQL.replace("use role r;", "use role q;"))) == len(SQL.strip().split("\n"))
+
+
+def test_save_failure_does_not_hide_the_script_error(deploy, tmp_path):
+    class FailingStore(LocalFingerprintStore):
+        def save(self, script_conn, script, fingerprints):
+            raise RuntimeError("save failed")
+
+    with pytest.raises(Exception, match="Simulated failure"):
+        deploy(SQL, FailingStore(str(tmp_path / "failing.json")),
+               fail_on=lambda statement: statement.startswith("create table"))
+    deploy(SQL, FailingStore(str(tmp_path / "failing.json")))
+
+
+def test_snowflake_store_restores_the_session_context():
+    conn = FakeConnection(row_width=3)
+    store = SnowflakeFingerprintStore(role="DCR_STATE")
+    store.save(conn, "script", ["a", "b"])
+    store.load(conn, "script")
+
+    assert conn.statements[:8] == [
+        "select current_role(), current_database(), current_schema()",
+        "use role DCR_STATE",
+        "create database if not exists DCR_DEPLOY_STATE",
+        "create schema if not exists DCR_DEPLOY_STATE.PUBLIC",
+        "create table if not exists DCR_DEPLOY_STATE.PUBLIC.STATEMENT_FINGERPRINTS (script string, "
+        "fingerprint string, deployed_at timestamp_ltz default current_timestamp())",
+        "delete from DCR_DEPLOY_STATE.PUBLIC.STATEMENT_FINGERPRINTS where script = %s",
+        "insert into DCR_DEPLOY_STATE.PUBLIC.STATEMENT_FINGERPRINTS (script, fingerprint) values (%s, %s)",
+        "insert into DCR_DEPLOY_STATE.PUBLIC.STATEMENT_FINGERPRINTS (script, fingerprint) values (%s, %s)",
+    ]
+    assert conn.statements[8:11] == ['use role "value"', 'use database "value"', 'use schema "value"."value"']
+    # Once the table exists only the role is switched and put back
+    assert conn.statements[11:] == [
+        "select current_role(), current_database(), current_schema()",
+        "use role DCR_STATE",
+        "select fingerprint from DCR_DEPLOY_STATE.PUBLIC.STATEMENT_FINGERPRINTS where script = %s",
+        'use role "value"',
+    ]
@@ -0,0 +1,76 @@
+"""
+Tests for execute_parallel
+"""
+import time
+
+import pytest
+
+from fake_snowflake import FakeConnection
+
+
+class RecordingConnection(FakeConnection):
+    """
+    A FakeConnection that records every statement across connections with its start and end time
+    """
+    log = None
+
+    def cursor(self, cursor_class=None):
+        cur = super().cursor(cursor_class)
+        execute = cur.execute
+
+        def timed_execute(command, *args, **kwargs):
+            start = time.perf_counter()
+            result = execute(command, *args, **kwargs)
+            self.log.append((command, start, time.perf_counter()))
+            return result
+
+        cur.execute = timed_execute
+        return cur
+
+
+def connections(*names, latency=0.05, fail_on=None):
+    log = []
+    conns = {}
+    for name in names:
+        conn = RecordingConnection(latency=latency, fail_on=fail_on, name=name)
+        conn.log = log
+        conns[name] = conn
+    return conns, log
+
+
+def test_scripts_on_different_connections_overlap(make_dcr):
+    conns, log = connections("provider", "consumer")
+    dcr = make_dcr({"provider": "select 1;\n", "consumer": "select 2;\n"}, conns,
+                   script_dependencies={"consumer": []})
+    dcr.execute_parallel()
+
+    (_, first_start, first_end), (_, second_start, second_end) = sorted(log, key=lambda entry: entry[1])
+    assert second_start < first_end
+
+
+def test_dependencies_run_first(make_dcr):
+    conns, log = connections("a", "b", "c")
+    dcr = make_dcr({"a": "select 'a';\n", "b": "select 'b';\n", "c": "select 'c';\n"}, conns,
+                   script_dependencies={"b": [], "c": ["a", "b"]})
+    dcr.execute_parallel()
+
+    ends = dict((command, end) for command, _, end in log)
+    starts = dict((command, start) for command, start, _ in log)
+    assert starts["select 'c';"] >= max(ends["select 'a';"], ends["select 'b';"])
+
+
+def test_failure_stops_dependents(make_dcr):
+    conns, log = connections("a", "b", "c", fail_on=lambda statement: "'a'" in statement)
+    dcr = make_dcr({"a": "select 'a';\n", "b": "select 'b';\n", "c": "select 'c';\n"}, conns,
+                   script_dependencies={"b": [], "c": ["a"]})
+    with pytest.raises(Exception, match="Simulated failure"):
+        dcr.execute_parallel()
+
+    assert [command for command, _, _ in log] == ["select 'b';"]
+
+
+def test_unsatisfiable_dependencies_raise(make_dcr):
+    conns, _ = connections("a", "b")
+    dcr = make_dcr({"a": "select 1;\n", "b": "select 2;\n"}, conns, script_dependencies={"a": ["b"]})
+    with pytest.raises(ValueError, match="cannot be satisfied"):
+        dcr.execute_parallel()
@@ -0,0 +1,62 @@
+"""
+Tests for RenderCache and its use when preparing scripts
+"""
+import os
+import time
+
+from fake_snowflake import FakeConnection
+from snowflake_dcr import RenderCache
+
+
+def test_key_depends_on_template_and_pairs(tmp_path):
+    template = tmp_path / "script.sql"
+    template.write_text("select 'SNOWCAT';\n", encoding="utf-8")
+    cache = RenderCache(str(tmp_path / "cache"))
+    key = cache.key(str(template), [("SNOWCAT", "A")])
+
+    assert cache.key(str(template), [("SNOWCAT", "A")]) == key
+    assert cache.key(str(template), [("SNOWCAT", "B")]) != key
+    template.write_text("select 'SNOWCAT', 1;\n", encoding="utf-8")
+    assert cache.key(str(template), [("SNOWCAT", "A")]) != key
+
+
+def test_get_counts_each_key_once_per_run(tmp_path):
+    prepared = tmp_path / "prepared.sql"
+    prepared.write_text("select 1;\n", encoding="utf-8")
+    cache = RenderCache(str(tmp_path / "cache"))
+
+    assert cache.get("k") is None
+    cached = cache.put("k", str(prepared))
+    assert cache.get("k") == cached
+    assert open(cached, encoding="utf-8").read() == "select 1;\n"
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    cache.reset_stats()
+    assert cache.get("k") == cached
+    assert cache.get("k") == cached
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_evict_removes_old_then_least_recently_used(tmp_path):
+    prepared = tmp_path / "prepared.sql"
+    prepared.write_text("x" * 100, encoding="utf-8")
+    cache = RenderCache(str(tmp_path / "cache"), max_bytes=250, max_age=60)
+    paths = [cache.put(key, str(prepared)) for key in ("old", "a", "b", "c")]
+    now = time.time()
+    for age, path in zip((120, 30, 20, 10), paths):
+        os.utime(path, (now - age, now - age))
+
+    cache.evict()
+    assert sorted(os.listdir(tmp_path / "cache")) == ["b.sql", "c.sql"]
+
+
+def test_repeated_debug_run_does_not_render(make_dcr, tmp_path):
+    renders = []
+    for _ in range(2):
+        dcr = make_dcr({"script": "select 'SNOWCAT';\n"}, {"script": FakeConnection()}, ["SNOWCAT"], ["ACCT"],
+                       is_debug_mode=True, render_cache=RenderCache(str(tmp_path / "cache")))
+        dcr.subscribe("render", lambda **details: renders.append(details["cached"]))
+        dcr.execute_locally()
+        with open(dcr._prepared_path("script"), encoding="utf-8") as fin:
+            assert fin.read() == "select 'ACCT';\n"
+    assert renders == [False, True]
@@ -0,0 +1,94 @@
+"""
+Tests for the statement journal and resume mode
+"""
+import pytest
+
+from fake_snowflake import FakeConnection
+
+
+def test_resume_starts_at_the_failed_statement(make_dcr, journal_statuses):
+    sql = "create table a (x int);\ninsert into a values (1);\ninsert into b values (2);\n"
+    failing = FakeConnection(fail_on=lambda statement: statement.startswith("insert into b"))
+    with pytest.raises(Exception):
+        make_dcr({"script": sql}, {"script": failing}).execute_locally()
+    assert journal_statuses() == [("script", 0, "succeeded"), ("script", 1, "succeeded"), ("script", 2, "failed")]
+
+    conn = FakeConnection()
+    make_dcr({"script": sql}, {"script": conn}, is_resuming=True).execute_locally()
+    assert conn.statements == ["insert into b values (2);"]
+
+
+def test_resume_resends_session_statements(make_dcr):
+    sql = ("use role r;\ncreate table a (x int);\nuse database d;\ninsert into a values (1);\n"
+           "insert into b values (2);\n")
+    failing = FakeConnection(fail_on=lambda statement: statement.startswith("insert into b"))
+    with pytest.raises(Exception):
+        make_dcr({"script": sql}, {"script": failing}).execute_locally()
+
+    conn = FakeConnection()
+    make_dcr({"script": sql}, {"script": conn}, is_resuming=True).execute_locally()
+    assert conn.statements == ["use role r;", "use database d;", "insert into b values (2);"]
+
+
+def test_resume_reruns_statements_whose_text_changed(make_dcr):
+    sql = "create table a (x int);\ninsert into b values (2);\n"
+    failing = FakeConnection(fail_on=lambda statement: statement.startswith("insert into b"))
+    with pytest.raises(Exception):
+        make_dcr({"script": sql}, {"script": failing}).execute_locally()
+
+    conn = FakeConnection()
+    make_dcr({"script": sql.replace("(x int)", "(x int, y int)")}, {"script": conn}, is_resuming=True).execute_locally()
+    assert conn.statements == ["create table a (x int, y int);", "insert into b values (2);"]
+
+
+@pytest.mark.parametrize("plan_a, plan_b", [
+    ({"check_words": ["PROVIDER_ACCT"], "replace_words": ["A"]},
+     {"check_words": ["PROVIDER_ACCT"], "replace_words": ["B"]}),
+    ({"conn_name": "account_a"}, {"conn_name": "account_b"}),
+])
+def test_plans_sharing_template_text_keep_separate_journals(make_dcr, plan_a, plan_b):
+    sql = "use role accountadmin;\ncreate role dcr_role;\ngrant role dcr_role to role sysadmin;\n"
+
+    def run(plan, **kwargs):
+        conn = FakeConnection(name=plan.get("conn_name", "fake"), **kwargs)
+        dcr = make_dcr({"provider_init": sql}, {"provider_init": conn}, plan.get("check_words", ()),
+                       plan.get("replace_words", ()), is_resuming=True)
+        try:
+            dcr.execute_locally()
+        except Exception:
+            pass
+        return conn
+
+    run(plan_a, fail_on=lambda statement: statement.startswith("create role"))
+    assert run(plan_b).statements == ["use role accountadmin;", "create role dcr_role;",
+                                      "grant role dcr_role to role sysadmin;"]
+    assert run(plan_a).statements == ["use role accountadmin;", "create role dcr_role;",
+                                      "grant role dcr_role to role sysadmin;"]
+
+
+@pytest.mark.parametrize("settings", [{}, {"batch_size": 4}, {"max_in_flight": 4}])
+def test_resume_restores_context_of_skipped_creates(make_dcr, journal_statuses, settings):
+    sql = ("use role r;\ncreate or replace database db1;\ncreate schema s1;\ncreate table t1 (x int);\n"
+           "create table t2 (x int);\n")
+    failing = FakeConnection(fail_on=lambda statement: statement.startswith("create table t2"))
+    with pytest.raises(Exception):
+        make_dcr({"script": sql}, {"script": failing}).execute_locally()
+
+    conn = FakeConnection()
+    make_dcr({"script": sql}, {"script": conn}, is_resuming=True, **settings).execute_locally()
+    assert conn.statements == ["use role r;", "use database db1;", "use schema s1;", "create table t2 (x int);"]
+    # Stand-ins are not journaled, so a later resume still skips the creates
+    assert [entry for entry in journal_statuses() if entry[2] == "succeeded"][-1] == ("script", 4, "succeeded")
+    assert len([entry for entry in journal_statuses() if entry[1] in (1, 2)]) == 2
+
+
+def test_create_database_resets_the_implied_schema(make_dcr):
+    sql = ("create schema db0.s0;\ncreate database db1;\ncreate schema db1.s1;\ncreate database db2;\n"
+           "create table t1 (x int);\n")
+    failing = FakeConnection(fail_on=lambda statement: statement.startswith("create table"))
+    with pytest.raises(Exception):
+        make_dcr({"script": sql}, {"script": failing}).execute_locally()
+
+    conn = FakeConnection()
+    make_dcr({"script": sql}, {"script": conn}, is_resuming=True).execute_locally()
+    assert conn.statements == ["use database db2;", "create table t1 (x int);"]
@@ -0,0 +1,87 @@
+"""
+Tests for SessionPool
+"""
+from fake_snowflake import FakeConnection
+from snowflake_dcr import SESSION_FACTS, SessionPool
+
+
+class SessionConnection(FakeConnection):
+    """
+    A FakeConnection that answers the session facts query with values for a fresh session
+    """
+    def __init__(self, **connect_args):
+        super().__init__(name=connect_args["account"])
+        warehouse = connect_args.get("warehouse")
+        self.facts = {"current_user": "DCR_USER", "current_role": "ACCOUNTADMIN", "current_account": self.name,
+                      "current_region": "AWS_US_WEST_2", "current_warehouse": warehouse.upper() if warehouse else None}
+
+    def cursor(self, cursor_class=None):
+        cur = super().cursor(cursor_class)
+        execute = cur.execute
+
+        def answering_execute(command, *args, **kwargs):
+            result = execute(command, *args, **kwargs)
+            if command.startswith("select current_"):
+                cur._rows = iter([tuple(self.facts[fact] for fact in SESSION_FACTS)])
+            return result
+
+        cur.execute = answering_execute
+        return cur
+
+
+def test_released_sessions_are_reused():
+    pool = SessionPool(connect=SessionConnection)
+    conn = pool.acquire("acct")
+    pool.release(conn)
+    assert pool.acquire("ACCT") is conn
+    assert pool.acquire("acct") is not conn
+    assert (pool.connects, pool.reuses) == (2, 1)
+
+
+def test_probes_are_answered_from_one_query():
+    pool = SessionPool(connect=SessionConnection)
+    conn = pool.acquire("acct")
+    assert pool.answer(conn, "select current_role();").fetchone() == ("ACCOUNTADMIN",)
+    assert pool.answer(conn, "select current_user(), current_account()").fetchone() == ("DCR_USER", "acct")
+    assert pool.answer(conn, "select current_database();") is None
+    assert (conn.round_trips, pool.answered) == (1, 2)
+
+
+def test_use_statements_update_the_facts():
+    pool = SessionPool(connect=SessionConnection)
+    conn = pool.acquire("acct")
+    pool.session_facts(conn)
+    pool.observe(conn, "use role dcr_role;")
+    pool.observe(conn, 'use warehouse "app_wh";')
+    assert pool.answer(conn, "select current_role(), current_warehouse()").fetchone() == ("DCR_ROLE", "app_wh")
+    assert conn.round_trips == 1
+
+
+def test_creating_a_warehouse_drops_the_facts():
+    pool = SessionPool(connect=SessionConnection)
+    conn = pool.acquire("acct", warehouse="app_wh")
+    assert pool.answer(conn, "select current_warehouse();").fetchone() == ("APP_WH",)
+    conn.cursor().execute("create or replace warehouse dcr_wh;")
+    conn.facts["current_warehouse"] = "DCR_WH"
+    pool.observe(conn, "create or replace warehouse dcr_wh;")
+    assert pool.answer(conn, "select current_warehouse();").fetchone() == ("DCR_WH",)
+
+
+def test_released_session_is_switched_back_to_its_warehouse():
+    pool = SessionPool(connect=SessionConnection)
+    conn = pool.acquire("acct", warehouse="app_wh")
+    pool.session_facts(conn)
+    pool.observe(conn, "create warehouse dcr_wh;")
+    pool.release(conn)
+    assert pool.acquire("acct", warehouse="app_wh") is conn
+    assert pool.reuses == 1
+    assert conn.statements[-1] == "use warehouse app_wh"
+
+
+def test_idle_sessions_are_closed():
+    pool = SessionPool(connect=SessionConnection, idle_timeout=0)
+    conn = pool.acquire("acct")
+    pool.release(conn)
+    pool.evict_idle()
+    assert conn.closed
+    assert pool.acquire("acct") is not conn
@@ -0,0 +1,65 @@
+"""
+Tests for result sinks
+"""
+import csv
+import sys
+
+import pytest
+
+from fake_snowflake import FakeConnection
+from snowflake_dcr import CountSink, FileSink, HeadSink
+
+
+class ResultCursor:
+    """
+    A cursor holding one result set, with an optional fetch_arrow_batches
+    """
+    def __init__(self, rows, columns=("A", "B"), arrow_batches=None):
+        self.query = "select a, b from t;"
+        self.description = [(column, None) for column in columns]
+        self.rowcount = len(rows)
+        self._rows = list(rows)
+        if arrow_batches is not None:
+            self.fetch_arrow_batches = lambda: iter(arrow_batches)
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+
+def read_csv(path):
+    with open(path, encoding="utf-8", newline="") as fin:
+        return list(csv.reader(fin))
+
+
+def test_count_sink_counts_rows(make_dcr):
+    sink = CountSink()
+    dcr = make_dcr({"script": "select 1;\nselect 2;\n"}, {"script": FakeConnection(rows=5)}, result_sink=sink)
+    dcr.execute_locally()
+    assert (sink.statements, sink.rows) == (2, 10)
+
+
+def test_head_sink_prints_the_first_rows(capsys):
+    HeadSink(n=2).consume("script", 0, ResultCursor([(1, "x"), (2, "y"), (3, "z")]))
+    assert capsys.readouterr().out.splitlines() == ["select a, b from t;", "(1, 'x')", "(2, 'y')", "... 1 more rows"]
+
+
+def test_file_sink_writes_csv_in_batches(tmp_path):
+    sink = FileSink(str(tmp_path / "results"), batch_size=2)
+    sink.consume("script", 3, ResultCursor([(1, "x"), (2, "y"), (3, "z")]))
+    assert read_csv(tmp_path / "results" / "script-3.csv") == [["A", "B"], ["1", "x"], ["2", "y"], ["3", "z"]]
+
+
+def test_arrow_falls_back_to_csv_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    sink = FileSink(str(tmp_path / "results"), format="arrow")
+    sink.consume("script", 0, ResultCursor([(1, "x")], arrow_batches=[]))
+    assert read_csv(tmp_path / "results" / "script-0.csv") == [["A", "B"], ["1", "x"]]
+
+
+def test_empty_arrow_result_is_written_as_csv(tmp_path):
+    pytest.importorskip("pyarrow")
+    sink = FileSink(str(tmp_path / "results"), format="arrow")
+    sink.consume("script", 0, ResultCursor([], arrow_batches=[]))
+    assert read_csv(tmp_path / "results" / "script-0.csv") == [["A", "B"]]
+    assert not (tmp_path / "results" / "script-0.arrow").exists()
@@ -0,0 +1,45 @@
+"""
+Tests for split_sql, the single-pass SQL lexer
+"""
+import io
+
+import pytest
+from snowflake.connector.util_text import split_statements
+
+from snowflake_dcr import split_sql
+
+
+def split(text):
+    return list(split_sql(io.StringIO(text)))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("select 'a;b';", ["select 'a;b';"]),
+    ("select 'it''s; here';", ["select 'it''s; here';"]),
+    ("select 'a\\';b';", ["select 'a\\';b';"]),
+    ('select 1 as "x;y";', ['select 1 as "x;y";']),
+    ("create function f() returns int as $$\nselect 1; -- kept\n$$;", ["create function f() returns int as $$\n"
+                                                                       "select 1; -- kept\n$$;"]),
+    ("select 1; -- comment; with semicolon\nselect 2;", ["select 1;", "select 2;"]),
+    ("// comment\nselect 1 /* inline; */ + 2;", ["select 1   + 2;"]),
+    ("/* spans\nlines; */select 1;", ["select 1;"]),
+    ("select '// not a comment', '--' from t;", ["select '// not a comment', '--' from t;"]),
+    ("put file:///tmp/data.csv @stage;", ["put file:///tmp/data.csv @stage;"]),
+    ("select 1;;\n;select 2", ["select 1;", "select 2"]),
+])
+def test_split_sql(text, expected):
+    assert [statement for statement, _ in split(text)] == expected
+
+
+def test_split_sql_flags_put_and_get():
+    assert [is_put_or_get for _, is_put_or_get in split("put file:///a @s;\nget @s file:///b;\nselect 1;")] == \
+        [True, True, False]
+
+
+def test_split_sql_matches_connector():
+    text = ("use role r;\n-- comment\ncreate table t (x string); // trailing\n"
+            "insert into t values ('a;b'), ('it''s');\n/* block\ncomment */\nselect $$x;\ny$$ from t;\n")
+    expected = [(statement, is_put_or_get)
+                for statement, is_put_or_get in split_statements(io.StringIO(text), remove_comments=True)
+                if statement]
+    assert split(text) == expected
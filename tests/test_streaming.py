@@ -0,0 +1,76 @@
+"""
+Tests for streaming rendered scripts straight to execution
+"""
+import os
+import shutil
+
+import snowflake_dcr
+from fake_snowflake import FakeConnection
+from snowflake_dcr import RenderCache
+
+SQL = "use role r;\n-- comment; here\ncreate table SNOWCAT_db.s.t (x int);\ninsert into t values ('a;b');\n"
+EXPECTED = ["use role r;", "create table ACCT_db.s.t (x int);", "insert into t values ('a;b');"]
+
+
+def run(make_dcr, **settings):
+    conn = FakeConnection()
+    dcr = make_dcr({"script": SQL}, {"script": conn}, ["SNOWCAT"], ["ACCT"], is_streaming=True, **settings)
+    dcr.execute_locally()
+    return dcr, conn
+
+
+def test_streams_without_writing_files(make_dcr):
+    dcr, conn = run(make_dcr)
+    assert conn.statements == EXPECTED
+    assert os.listdir(dcr.workspace) == []
+
+
+def test_write_prepared_keeps_the_rendered_script(make_dcr):
+    dcr, conn = run(make_dcr, write_prepared=True)
+    assert conn.statements == EXPECTED
+    with open(dcr._prepared_path("script"), encoding="utf-8") as fin:
+        assert fin.read() == SQL.replace("SNOWCAT", "ACCT")
+
+
+def test_cache_miss_is_written_once_into_the_cache(make_dcr, tmp_path, monkeypatch):
+    streams = []
+
+    class CountingStream(snowflake_dcr.RenderedStream):
+        def __init__(self, *args, **kwargs):
+            streams.append(self)
+            super().__init__(*args, **kwargs)
+
+    def no_copy(*args):
+        raise AssertionError("rendered text copied on a cache miss")
+
+    monkeypatch.setattr(snowflake_dcr, "RenderedStream", CountingStream)
+    monkeypatch.setattr(shutil, "copyfile", no_copy)
+    cache_directory = tmp_path / "cache"
+    dcr, conn = run(make_dcr, render_cache=RenderCache(str(cache_directory)))
+    assert conn.statements == EXPECTED
+    assert len(streams) == 1
+    assert (dcr.render_cache.hits, dcr.render_cache.misses) == (0, 1)
+    assert [name.endswith(".sql") for name in os.listdir(cache_directory)] == [True]
+
+    dcr, conn = run(make_dcr, render_cache=RenderCache(str(cache_directory)))
+    assert conn.statements == EXPECTED
+    assert len(streams) == 1
+    assert (dcr.render_cache.hits, dcr.render_cache.misses) == (1, 0)
+
+
+def test_validation_leaves_cache_misses_to_the_stream(make_dcr, tmp_path, monkeypatch):
+    teed = []
+
+    class TeeingStream(snowflake_dcr.RenderedStream):
+        def __init__(self, blocks, side_output=None, on_complete=None):
+            if side_output is not None:
+                teed.append(self)
+            super().__init__(blocks, side_output, on_complete)
+
+    monkeypatch.setattr(snowflake_dcr, "RenderedStream", TeeingStream)
+    cache_directory = tmp_path / "cache"
+    dcr, conn = run(make_dcr, render_cache=RenderCache(str(cache_directory)), is_validating=True)
+    assert conn.statements == EXPECTED
+    assert len(teed) == 1
+    assert (dcr.render_cache.hits, dcr.render_cache.misses) == (0, 1)
+    assert [name.endswith(".sql") for name in os.listdir(cache_directory)] == [True]
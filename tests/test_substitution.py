@@ -0,0 +1,41 @@
+"""
+Tests for SubstitutionEngine
+"""
+from snowflake_dcr import SubstitutionEngine
+
+
+def replace_lines(lines, pairs):
+    result = []
+    for line in lines:
+        for check, replace in pairs:
+            line = line.replace(check, replace)
+        result.append(line)
+    return "".join(result)
+
+
+def test_blockwise_substitution_matches_ordered_lines():
+    engine = SubstitutionEngine(["SNOWCAT", "SNOWCAT2", "_DEMO_", "AB"], ["A", "B", "_xy_", "C"])
+    engine.block_size = 16
+    lines = ["SNOWCAT2 and SNOWCAT\n", "dcr_DEMO_app AB\n", "SNOWCATSNOWCAT2\n"] * 5
+    assert "".join(engine.substitute_lines(lines)) == replace_lines(lines, engine.pairs)
+
+
+def test_replacement_spanning_lines_matches_ordered_lines():
+    engine = SubstitutionEngine(["X", "b"], ["a\nb", "c"])
+    engine.block_size = 4
+    lines = ["X b\n", "bX\n"] * 3
+    assert "".join(engine.substitute_lines(lines)) == replace_lines(lines, engine.pairs)
+
+
+def test_empty_and_multiline_check_words_apply_line_by_line():
+    for check in ("", "a\nb"):
+        engine = SubstitutionEngine([check], ["Z"])
+        assert not engine.is_blockwise
+        lines = ["a\n", "b\n"]
+        assert "".join(engine.substitute_lines(lines)) == replace_lines(lines, engine.pairs)
+
+
+def test_replacements_expand_later_pairs():
+    engine = SubstitutionEngine(["SNOWCAT", "PROV"], ["PROV_ACCT", "P1"])
+    assert engine.replacements == {"SNOWCAT": "P1_ACCT", "PROV": "P1"}
+    assert engine.substitute("SNOWCAT PROV") == "P1_ACCT P1"
@@ -0,0 +1,51 @@
+"""
+Tests for SnowflakeDcr.validate and how runs use it
+"""
+import os
+
+import pytest
+
+from fake_snowflake import FakeConnection
+from snowflake_dcr import DcrValidationError, RenderCache
+
+
+def plan(make_dcr, scripts, **settings):
+    conns = dict((name, FakeConnection()) for name in scripts)
+    dcr = make_dcr(scripts, conns, ["SNOWCAT", "_DEMO_"], ["ACCT", "_abc_"], is_validating=True, **settings)
+    return dcr, conns
+
+
+def test_unreplaced_placeholders_raise_before_anything_is_sent(make_dcr):
+    dcr, conns = plan(make_dcr, {"a": "select 'SNOWCAT';\n", "b": "select 'snowcat2', 'dcr_demo_db';\n"})
+    with pytest.raises(DcrValidationError) as error:
+        dcr.execute_locally()
+    assert error.value.errors == ["b statement 0: unreplaced _demo_", "b statement 0: unreplaced snowcat2"]
+    assert conns["a"].statements == []
+
+
+def test_missing_template_is_an_error(make_dcr):
+    dcr, _ = plan(make_dcr, {"a": "select 1;\n"})
+    os.remove(dcr.path + "a.sql")
+    with pytest.raises(DcrValidationError, match="template .* not found"):
+        dcr.validate()
+
+
+def test_objects_used_before_they_are_created_are_warned_about(make_dcr):
+    dcr, _ = plan(make_dcr, {"a": "insert into db.s.t values (1);\n", "b": "create table db.s.t (x int);\n",
+                             "c": "select * from db2.s.t;\n"})
+    assert dcr.validate() == ["a statement 0: DB.S.T is only created later, by b",
+                              "c statement 0: DB2.S.T is not created by any script in the plan"]
+
+
+def test_debug_mode_prints_errors(make_dcr, capsys):
+    dcr, _ = plan(make_dcr, {"a": "select 'snowcat2';\n"}, is_debug_mode=True)
+    dcr.execute_locally()
+    assert "Validation error: a statement 0: unreplaced snowcat2" in capsys.readouterr().out
+
+
+def test_cold_run_reports_cache_misses(make_dcr, tmp_path, capsys):
+    scripts = {"a": "select 'SNOWCAT';\n", "b": "select 2;\n"}
+    for expected in ("Render cache: 0 hits, 2 misses", "Render cache: 2 hits, 0 misses"):
+        dcr, _ = plan(make_dcr, scripts, render_cache=RenderCache(str(tmp_path / "cache")))
+        dcr.execute_locally()
+        assert expected in capsys.readouterr().out
@@ -0,0 +1,56 @@
+"""
+Tests for per-run output workspaces
+"""
+import os
+import time
+
+from fake_snowflake import FakeConnection
+
+SQL = "select 'SNOWCAT';\n"
+
+
+def debug_run(make_dcr, **settings):
+    dcr = make_dcr({"script": SQL}, {"script": FakeConnection()}, ["SNOWCAT"], ["ACCT"], is_debug_mode=True,
+                   **settings)
+    dcr.execute_locally()
+    return dcr
+
+
+def test_each_run_writes_to_its_own_workspace(make_dcr, tmp_path):
+    first = debug_run(make_dcr)
+    second = debug_run(make_dcr)
+    assert first.workspace != second.workspace
+    for dcr in (first, second):
+        assert os.path.dirname(dcr.workspace) == str(tmp_path / "output")
+        assert os.path.basename(dcr.workspace).startswith("run-")
+        assert sorted(os.listdir(dcr.workspace)) == ["script-prepared.sql"]
+        with open(dcr._prepared_path("script"), encoding="utf-8") as fin:
+            assert fin.read() == "select 'ACCT';\n"
+
+
+def test_oldest_finished_workspaces_beyond_keep_runs_are_removed(make_dcr):
+    workspaces = []
+    for _ in range(4):
+        workspaces.append(debug_run(make_dcr, keep_runs=2).workspace)
+        # Workspaces are ordered by modification time
+        os.utime(workspaces[-1], (time.time() - 100 + len(workspaces), time.time() - 100 + len(workspaces)))
+    assert [os.path.exists(workspace) for workspace in workspaces] == [False, True, True, True]
+
+
+def test_active_workspaces_are_kept(make_dcr, tmp_path):
+    running = tmp_path / "output" / "run-other-process"
+    running.mkdir(parents=True)
+    (running / ".active").touch()
+    os.utime(running, (0, 0))
+    debug_run(make_dcr, keep_runs=0)
+    debug_run(make_dcr, keep_runs=0)
+    assert running.exists()
+
+    os.utime(running / ".active", (0, 0))
+    debug_run(make_dcr, keep_runs=0)
+    assert not running.exists()
+
+
+def test_keep_runs_none_keeps_every_workspace(make_dcr):
+    workspaces = [debug_run(make_dcr, keep_runs=None).workspace for _ in range(3)]
+    assert all(os.path.exists(workspace) for workspace in workspaces)